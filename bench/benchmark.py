@@ -0,0 +1,230 @@
+"""
+Time the stages of main.py on synthetic results trees of several sizes:
+discovery (get_test_result_files), wrk parsing (get_rps_and_latency), dstat
+loading (get_summary_stat_rows), aggregation (summarize_framework),
+aggregation with the bootstrap intervals of --confidence, encoding the
+summaries into the output files (TestResultsWriter) and start() end to end.
+Each timing is the best of a few repeats. The peak memory allocated while
+encoding and the memory held by the summaries are measured with tracemalloc.
+With --save the timings are added to bench/results.json, and every run
+compares itself with the last saved timings of the same scale so regressions
+show up.
+"""
+
+import contextlib
+import io
+import json
+import os
+import pickle
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main  # noqa: E402
+from generate_results import generate  # noqa: E402
+
+ResultsFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.json")
+# Slowdown over the saved timings reported as a regression
+RegressionRatio = 1.2
+
+
+def best_of(repeat: int, function) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def get_tree(frameworks: int, seed: int) -> str:
+    """
+    Generate the tree of a scale once and keep it in the temp directory, the
+    generator is deterministic so it can be reused by later runs.
+    """
+    root = os.path.join(tempfile.gettempdir(), "tfbvis-bench", f"{frameworks}-{seed}")
+    results_dir = os.path.join(root, "results", "20200317000000")
+    if not os.path.isfile(os.path.join(results_dir, "test_metadata.json")):
+        print(f"Generating {frameworks} frameworks in {root}")
+        generate(root, frameworks, seed)
+    return results_dir
+
+
+def benchmark(frameworks: int, repeat: int, seed: int = 1) -> dict:
+    results_dir = get_tree(frameworks, seed)
+    units = list(main.get_test_result_files(results_dir))
+    raws = [files.raw for _, _, files in units if main.result_file_exists(files.raw)]
+    parsed = [
+        (test, framework, files, main.get_framework_rps_and_latency(files, "fast"))
+        for test, framework, files in units
+    ]
+    parsed = [p for p in parsed if p[3]]
+    windows = [
+        (framework, files.stats, rpslats) for _, framework, files, rpslats in parsed
+    ]
+    frames = []
+    for framework, stats, rpslats in windows:
+        columns, epoch, values = get_window(stats, rpslats)
+        frames.append((framework, rpslats, epoch, values, 1, 0, columns))
+
+    summaries = [
+        (test, main.summarize_framework(*frame))
+        for (test, *_), frame in zip(parsed, frames)
+    ]
+
+    pickled = pickle.dumps([summary for _, summary in summaries])
+
+    def run_encode():
+        with tempfile.TemporaryDirectory() as output:
+            with contextlib.redirect_stdout(io.StringIO()):
+                with main.TestResultsWriter(output, []) as writer:
+                    for test, summary in summaries:
+                        if summary:
+                            writer.add(test, summary)
+
+    def run_start():
+        with tempfile.TemporaryDirectory() as cwd:
+            previous = os.getcwd()
+            os.chdir(cwd)
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    main.start([(results_dir, "bench")], main.Options(force=True))
+            finally:
+                os.chdir(previous)
+
+    return {
+        "frameworks": frameworks,
+        "units": len(units),
+        "discovery": best_of(
+            repeat, lambda: list(main.get_test_result_files(results_dir))
+        ),
+        "raw": best_of(
+            repeat, lambda: [main.get_rps_and_latency(r, "fast") for r in raws]
+        ),
+        "stats": best_of(
+            repeat, lambda: [get_window(s, rpslats) for _, s, rpslats in windows]
+        ),
+        "aggregate": best_of(
+            repeat,
+            lambda: [main.summarize_framework(*frame) for frame in frames],
+        ),
+        "confidence": best_of(
+            repeat,
+            lambda: [
+                main.summarize_framework(*frame[:5], main.BootstrapResamples, frame[6])
+                for frame in frames
+            ],
+        ),
+        "encode": best_of(repeat, run_encode),
+        "start": best_of(repeat, run_start),
+        "encode_kb": get_allocated_kb(run_encode)[1],
+        # the summaries as unpickled, without the arrays they were made from
+        "summaries_kb": get_allocated_kb(lambda: pickle.loads(pickled))[0],
+    }
+
+
+def get_allocated_kb(function) -> tuple:
+    """
+    The KB still allocated after a call, which includes what it returns, and
+    the peak KB allocated during it, traced by tracemalloc.
+    """
+    tracemalloc.start()
+    try:
+        result = function()  # noqa: F841, kept alive to count its memory
+        current, peak = tracemalloc.get_traced_memory()
+        return current / 1024, peak / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def get_window(stats: str, rpslats: list) -> tuple:
+    """
+    The columns, epochs and rows of the dstat window of all the sections, as
+    get_framework_summary reads them.
+    """
+    start = min(r.starttime for r in rpslats) + 1
+    end = max(r.endtime for r in rpslats)
+    return main.get_summary_stat_rows(stats, start, end)
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(ResultsFile),
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+
+def load_results() -> list:
+    if not os.path.isfile(ResultsFile):
+        return []
+    with open(ResultsFile, "r") as f:
+        return json.load(f)
+
+
+def compare(timings: dict, saved: list):
+    """
+    Print each stage against the last saved timings of the same scale.
+    """
+    previous = [s for s in saved if s["frameworks"] == timings["frameworks"]]
+    print(f"{timings['frameworks']} frameworks, {timings['units']} tests")
+    stages = ["discovery", "raw", "stats", "aggregate", "confidence", "encode", "start"]
+    for stage in stages + ["encode_kb", "summaries_kb"]:
+        unit = "KB" if stage.endswith("_kb") else "s"
+        line = f"  {stage:<12}{timings[stage]:>9.3f}{unit}"
+        if previous and stage in previous[-1]:
+            ratio = timings[stage] / previous[-1][stage]
+            flag = "  REGRESSION" if ratio > RegressionRatio else ""
+            line += f"  {ratio:>5.2f}x of {previous[-1]['commit']}{flag}"
+        print(line)
+
+
+def main_benchmark(args):
+    scales = [10, 50, 200]
+    repeat = 3
+    save = False
+    for arg in args:
+        key, _, value = arg[2:].partition("=")
+        if key == "scales":
+            scales = [int(s) for s in value.split(",")]
+        elif key == "repeat":
+            repeat = int(value)
+        elif key == "save":
+            save = True
+        else:
+            print(
+                "Optional arguments:"
+                + "\n--scales=10,50,200: numbers of frameworks to benchmark"
+                + "\n--repeat=3: repeats of each timing, the best is kept"
+                + "\n--save: add the timings to bench/results.json"
+            )
+            return
+
+    saved = load_results()
+    commit = get_commit()
+    for frameworks in scales:
+        timings = benchmark(frameworks, repeat)
+        timings["commit"] = commit
+        timings["date"] = time.strftime("%Y-%m-%d")
+        timings["python"] = platform.python_version()
+        timings["machine"] = platform.machine()
+        compare(timings, saved)
+        if save:
+            saved.append(timings)
+
+    if save:
+        with open(ResultsFile, "w") as f:
+            f.write(json.dumps(saved, indent=2))
+        print(f"Saved to {ResultsFile}")
+
+
+if __name__ == "__main__":
+    main_benchmark(sys.argv[1:])
@@ -0,0 +1,244 @@
+"""
+Write a synthetic results tree shaped like a TFB run, for benchmarks and for
+trying changes to main.py without downloading a run:
+
+    results/<timestamp>/test_metadata.json
+    results/<timestamp>/<framework>/<test>/{verification.txt, raw.txt, stats.txt}
+
+The wrk and dstat files follow the layout of real runs: primer and warmup
+sections, Concurrency or Queries sections with STARTTIME/ENDTIME, socket
+errors and Non-2xx lines, and dstat CSV with its info lines and two header
+rows, with per-core CPU columns like the Citrine machines.
+"""
+
+import json
+import os
+import random
+import shutil
+import sys
+
+TestTypes = ["cached-query", "db", "fortune", "json", "plaintext", "query", "update"]
+Languages = ["c", "go", "java", "javascript", "php", "python", "ruby", "rust"]
+Timestamp = "20200317000000"
+
+
+def format_time(ms: float) -> str:
+    if ms < 1:
+        return f"{ms * 1000:.2f}us"
+    if ms >= 1000:
+        return f"{ms / 1000:.2f}s"
+    return f"{ms:.2f}ms"
+
+
+def format_count(value: float) -> str:
+    if value >= 1e6:
+        return f"{value / 1e6:.2f}M"
+    if value >= 1e3:
+        return f"{value / 1e3:.2f}k"
+    return f"{value:.2f}"
+
+
+def format_megabytes(mb: float) -> str:
+    if mb >= 1e3:
+        return f"{mb / 1e3:.2f}GB"
+    if mb < 1:
+        return f"{mb * 1e3:.2f}KB"
+    return f"{mb:.2f}MB"
+
+
+def wrk_header(title: str, connections: int) -> list:
+    return [
+        "-" * 57,
+        f" {title}",
+        " wrk -H 'Host: tfb-server' -H 'Accept: application/json' --latency"
+        + f" -d 15 -c {connections} --timeout 8 -t 28 http://tfb-server:8080/x",
+        "-" * 57,
+    ]
+
+
+def wrk_output(
+    rnd: random.Random, threads: int, connections: int, seconds: int = 15
+) -> list:
+    latency = rnd.uniform(0.1, 50)
+    rps = rnd.uniform(1e3, 1e6)
+    count = int(rps * seconds)
+    lines = [
+        f"Running {seconds}s test @ http://tfb-server:8080/x",
+        f"  {threads} threads and {connections} connections",
+        "  Thread Stats   Avg      Stdev     Max   +/- Stdev",
+        f"    Latency   {format_time(latency)}   {format_time(latency / 3)}"
+        + f"  {format_time(latency * 8)}   {rnd.uniform(60, 99):.2f}%",
+        f"    Req/Sec   {format_count(rps / threads)}"
+        + f"   {format_count(rps / threads / 10)}"
+        + f"  {format_count(rps / threads * 1.5)}   {rnd.uniform(60, 99):.2f}%",
+        "  Latency Distribution",
+        f"     50%  {format_time(latency * 0.8)}",
+        f"     75%  {format_time(latency * 1.1)}",
+        f"     90%  {format_time(latency * 1.5)}",
+        f"     99%  {format_time(latency * 4)}",
+        f"  {count} requests in {seconds + 0.01 * rnd.randint(1, 9):.2f}s,"
+        + f" {format_megabytes(count * 150 / 1e6)} read",
+    ]
+    if rnd.random() < 0.1:
+        lines.append(
+            f"  Socket errors: connect 0, read {rnd.randint(0, 30)},"
+            + f" write 0, timeout {rnd.randint(0, 30)}"
+        )
+    if rnd.random() < 0.1:
+        lines.append(f"  Non-2xx or 3xx responses: {rnd.randint(1, count)}")
+    lines.append(f"Requests/sec: {count / seconds:.2f}")
+    lines.append(f"Transfer/sec: {format_megabytes(count * 150 / 1e6 / seconds)}")
+    return lines
+
+
+def get_raw(rnd: random.Random, test: str, start: int) -> (str, int):
+    """
+    The raw.txt of a test starting at the given epoch, and the epoch it ends.
+    """
+    if test in ("query", "update"):
+        label, levels = "Queries", [1, 5, 10, 15, 20]
+    elif test == "cached-query":
+        label, levels = "Queries", [1, 10, 20, 50, 100]
+    elif test == "plaintext":
+        label, levels = "Concurrency", [256, 1024, 4096, 16384]
+    else:
+        label, levels = "Concurrency", [16, 32, 64, 128, 256, 512]
+
+    lines = wrk_header(f"Running Primer {test}", 8) + wrk_output(rnd, 8, 8, 5)
+    lines += wrk_header(f"Running Warmup {test}", 512) + wrk_output(rnd, 28, 512)
+    epoch = start + 30
+    for level in levels:
+        connections = 512 if label == "Queries" else level
+        lines += wrk_header(f"{label}: {level} for {test}", connections)
+        lines += wrk_output(rnd, min(connections, 28), connections)
+        lines.append(f"STARTTIME {epoch}")
+        lines.append(f"ENDTIME {epoch + 15}")
+        epoch += 17
+    return "\n".join(lines) + "\n", epoch
+
+
+StatGroups = [
+    ("total cpu usage", ["usr", "sys", "idl", "wai", "hiq", "siq"]),
+    ("dsk/total", ["read", "writ"]),
+    ("net/total", ["recv", "send"]),
+    ("paging", ["in", "out"]),
+    ("system", ["int", "csw"]),
+    ("load avg", ["1m", "5m", "15m"]),
+    ("memory usage", ["used", "buff", "cach", "free"]),
+    ("swap", ["used", "free"]),
+    ("tcp sockets", ["lis", "act", "syn", "tim", "clo"]),
+]
+
+
+def get_stats(rnd: random.Random, start: int, end: int, cores: int) -> str:
+    """
+    The dstat stats.txt sampled every second from a little before start to a
+    little after end.
+    """
+    groups = [
+        (f"cpu{c} usage", ["usr", "sys", "idl", "wai", "hiq", "siq"])
+        for c in range(cores)
+    ] + StatGroups
+    groups.insert(0, ("epoch", ["epoch"]))
+    names, columns = [], []
+    for name, group in groups:
+        names += [f'"{name}"'] + [""] * (len(group) - 1)
+        columns += [f'"{c}"' for c in group]
+
+    lines = [
+        '"Dstat 0.7.3 CSV output"',
+        '"Author:","Dag Wieers <dag@wieers.com>",,,,"URL:",'
+        + '"http://dag.wieers.com/home-made/dstat/"',
+        '"Host:","tfb-server",,,,"User:","root"',
+        '"Cmdline:","dstat -Tafilmprs --aio --fs --ipc --lock --raw --socket'
+        + ' --tcp --udp --unix --vm --output stats.txt",,,,"Date:",'
+        + '"17 Mar 2020 12:00:00 UTC"',
+        ",".join(names),
+        ",".join(columns),
+    ]
+    memory = rnd.uniform(1e8, 8e9)
+    epoch = start - 5 + rnd.random()
+    while epoch < end + 5:
+        row = [f"{epoch:.3f}"]
+        for name, group in groups[1:]:
+            for column in group:
+                if name == "memory usage" and column == "used":
+                    row.append(f"{memory + rnd.uniform(-1e6, 1e6):.0f}")
+                elif name.endswith(" usage") and "cpu" in name:
+                    row.append(f"{rnd.uniform(0, 50):.3f}")
+                else:
+                    row.append(f"{rnd.uniform(0, 1e5):.0f}")
+        lines.append(",".join(row))
+        epoch += 1
+    return "\n".join(lines) + "\n"
+
+
+def generate(root: str, frameworks: int, seed: int = 1, cores: int = 28) -> str:
+    """
+    Write the results of the given number of frameworks under root and return
+    the timestamped results directory.
+    """
+    rnd = random.Random(seed)
+    results_dir = os.path.join(root, "results", Timestamp)
+    os.makedirs(results_dir, exist_ok=True)
+
+    metadata = []
+    for i in range(frameworks):
+        framework = f"framework{i:05d}"
+        language = rnd.choice(Languages)
+        metadata.append(
+            {
+                "name": framework,
+                "display_name": framework,
+                "language": language,
+                "platform": language,
+                "webserver": "none",
+                "classification": rnd.choice(["fullstack", "micro", "platform"]),
+                "database": rnd.choice(["none", "postgres", "mysql", "mongodb"]),
+                "orm": rnd.choice(["full", "micro", "raw"]),
+                "framework": framework,
+            }
+        )
+        for test in TestTypes:
+            test_dir = os.path.join(results_dir, framework, test)
+            os.makedirs(test_dir, exist_ok=True)
+            passed = rnd.random() > 0.05
+            with open(os.path.join(test_dir, "verification.txt"), "w") as f:
+                f.write(f"VERIFYING {test.upper()} (/{test})\n")
+                f.write(f"   {'PASS' if passed else 'FAIL'} for http://tfb-server/\n")
+            if not passed:
+                continue
+
+            start = 1584403200 + rnd.randint(0, 100000)
+            raw, end = get_raw(rnd, test, start)
+            with open(os.path.join(test_dir, "raw.txt"), "w") as f:
+                f.write(raw)
+            with open(os.path.join(test_dir, "stats.txt"), "w") as f:
+                f.write(get_stats(rnd, start, end, cores))
+
+    with open(os.path.join(results_dir, "test_metadata.json"), "w") as f:
+        f.write(json.dumps(metadata))
+    return results_dir
+
+
+def main(args):
+    zipped = "--zip" in args
+    args = [a for a in args if a != "--zip"]
+    if len(args) not in (2, 3):
+        print(
+            "Arguments: output directory, number of frameworks, optional seed"
+            + "\n--zip: also write the tree as <output directory>.zip"
+        )
+        return
+
+    root, frameworks = args[0], int(args[1])
+    seed = int(args[2]) if len(args) == 3 else 1
+    print(f"Writing {frameworks} frameworks to {root}")
+    generate(root, frameworks, seed)
+    if zipped:
+        print(f"Writing {root}.zip")
+        shutil.make_archive(root, "zip", root)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,117 @@
+"""
+Measure the cold start of the lightweight commands of main.py, each in a new
+interpreter: printing the help, importing the module, and an incremental
+rerun of a generated run that reuses every framework. Each timing is the best
+of a few repeats. The modules that the core path must not import (pandas,
+pyparsing, simplejson) are checked too.
+
+Every command needs numpy, so its budget is the time it may take on top of a
+bare "import numpy" timed on the same machine: by default 0.25 seconds for
+the help and the import and 0.75 seconds for the rerun. --budget-help,
+--budget-import and --budget-rerun change them.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from benchmark import get_tree  # noqa: E402
+
+Main = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py"
+)
+# Seconds of wall time each command may take beyond "import numpy", which is
+# timed alongside so the budgets hold on slower and faster machines alike
+Budgets = {"help": 0.25, "import": 0.25, "rerun": 0.75}
+HeavyModules = ["pandas", "pyparsing", "simplejson"]
+
+
+def best_of(repeat: int, command: list, cwd: str) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run(command, cwd=cwd, capture_output=True, check=True)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def get_imported(args: list, cwd: str) -> list:
+    """
+    The heavy modules imported by running main.py with the given arguments.
+    """
+    script = (
+        f"import sys; sys.argv = [{Main!r}] + {args!r}; sys.path.insert(0, "
+        + f"{os.path.dirname(Main)!r}); import main; main.main(sys.argv[1:]); "
+        + f"print(__import__('json').dumps([m for m in {HeavyModules!r}"
+        + " if m in sys.modules]))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script], cwd=cwd, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main_startup(args):
+    frameworks = 50
+    repeat = 5
+    budgets = dict(Budgets)
+    for arg in args:
+        key, _, value = arg[2:].partition("=")
+        if key == "frameworks":
+            frameworks = int(value)
+        elif key == "repeat":
+            repeat = int(value)
+        elif key.startswith("budget-") and key[7:] in budgets:
+            budgets[key[7:]] = float(value)
+        else:
+            print(
+                "Optional arguments:"
+                + "\n--frameworks=50: frameworks of the run that is processed again"
+                + "\n--repeat=5: repeats of each timing, the best is kept"
+                + "\n--budget-help=0.25, --budget-import=0.25, --budget-rerun=0.75:"
+                + " seconds\n  each command may take beyond a bare 'import numpy'"
+            )
+            return
+
+    # the root of the generated run, as given on the command line
+    root = os.path.dirname(os.path.dirname(get_tree(frameworks, 1)))
+    with tempfile.TemporaryDirectory() as cwd:
+        rerun = [Main, root, "bench"]
+        # the first run writes the manifest the reruns reuse
+        subprocess.run([sys.executable] + rerun, cwd=cwd, capture_output=True)
+        timings = {
+            "python": best_of(repeat, [sys.executable, "-c", "pass"], cwd),
+            "numpy": best_of(repeat, [sys.executable, "-c", "import numpy"], cwd),
+            "help": best_of(repeat, [sys.executable, Main, "--help"], cwd),
+            "import": best_of(
+                repeat,
+                [
+                    sys.executable,
+                    "-c",
+                    f"import sys; sys.path.insert(0, "
+                    f"{os.path.dirname(Main)!r}); import main",
+                ],
+                cwd,
+            ),
+            "rerun": best_of(repeat, [sys.executable] + rerun, cwd),
+        }
+        imported = get_imported([root, "bench"], cwd)
+
+    for command, seconds in timings.items():
+        line = f"  {command:<8}{seconds:>7.3f}s"
+        if command in budgets:
+            extra = seconds - timings["numpy"]
+            over = extra > budgets[command]
+            line += f"  numpy +{extra:.3f}s, budget +{budgets[command]:.2f}s"
+            line += "  OVER BUDGET" if over else ""
+        print(line)
+    if imported:
+        print(f"  the core path imported {', '.join(imported)}")
+
+
+if __name__ == "__main__":
+    main_startup(sys.argv[1:])
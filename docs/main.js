@@ -222,6 +222,7 @@ let columnDefs = [
         headerName: "Mean",
         field: "memory.mean",
         filter: "agNumberColumnFilter",
+        tooltipValueGetter: confidenceTooltip,
         valueFormatter: memoryFormatter,
       },
       {
@@ -237,6 +238,7 @@ let columnDefs = [
         headerName: "Median",
         field: "memory.median",
         filter: "agNumberColumnFilter",
+        tooltipValueGetter: confidenceTooltip,
         hide: true,
         valueFormatter: memoryFormatter,
       },
@@ -244,6 +246,7 @@ let columnDefs = [
         headerName: "Stdev",
         field: "memory.stdev",
         filter: "agNumberColumnFilter",
+        tooltipValueGetter: confidenceTooltip,
         hide: true,
         valueFormatter: memoryFormatter,
       },
@@ -270,6 +273,7 @@ let columnDefs = [
         headerName: "Mean",
         field: "sys.mean",
         filter: "agNumberColumnFilter",
+        tooltipValueGetter: confidenceTooltip,
         hide: true,
         valueFormatter: cpuFormatter,
       },
@@ -287,6 +291,21 @@ let columnDefs = [
         headerName: "Median",
         field: "sys.median",
         filter: "agNumberColumnFilter",
+        tooltipValueGetter: confidenceTooltip,
+        hide: true,
+        valueFormatter: cpuFormatter,
+      },
+      {
+        headerName: "p95",
+        field: "sys.p95",
+        filter: "agNumberColumnFilter",
+        hide: true,
+        valueFormatter: cpuFormatter,
+      },
+      {
+        headerName: "p99",
+        field: "sys.p99",
+        filter: "agNumberColumnFilter",
         hide: true,
         valueFormatter: cpuFormatter,
       },
@@ -294,6 +313,7 @@ let columnDefs = [
         headerName: "Stdev",
         field: "sys.stdev",
         filter: "agNumberColumnFilter",
+        tooltipValueGetter: confidenceTooltip,
         hide: true,
         valueFormatter: cpuFormatter,
       },
@@ -320,6 +340,7 @@ let columnDefs = [
         headerName: "Mean",
         field: "usr.mean",
         filter: "agNumberColumnFilter",
+        tooltipValueGetter: confidenceTooltip,
         hide: true,
         valueFormatter: cpuFormatter,
       },
@@ -337,6 +358,21 @@ let columnDefs = [
         headerName: "Median",
         field: "usr.median",
         filter: "agNumberColumnFilter",
+        tooltipValueGetter: confidenceTooltip,
+        hide: true,
+        valueFormatter: cpuFormatter,
+      },
+      {
+        headerName: "p95",
+        field: "usr.p95",
+        filter: "agNumberColumnFilter",
+        hide: true,
+        valueFormatter: cpuFormatter,
+      },
+      {
+        headerName: "p99",
+        field: "usr.p99",
+        filter: "agNumberColumnFilter",
         hide: true,
         valueFormatter: cpuFormatter,
       },
@@ -344,6 +380,7 @@ let columnDefs = [
         headerName: "Stdev",
         field: "usr.stdev",
         filter: "agNumberColumnFilter",
+        tooltipValueGetter: confidenceTooltip,
         hide: true,
         valueFormatter: cpuFormatter,
       },
@@ -370,6 +407,7 @@ let columnDefs = [
         headerName: "Mean",
         field: "cpu.mean",
         filter: "agNumberColumnFilter",
+        tooltipValueGetter: confidenceTooltip,
         valueFormatter: cpuFormatter,
       },
       {
@@ -385,6 +423,21 @@ let columnDefs = [
         headerName: "Median",
         field: "cpu.median",
         filter: "agNumberColumnFilter",
+        tooltipValueGetter: confidenceTooltip,
+        hide: true,
+        valueFormatter: cpuFormatter,
+      },
+      {
+        headerName: "p95",
+        field: "cpu.p95",
+        filter: "agNumberColumnFilter",
+        hide: true,
+        valueFormatter: cpuFormatter,
+      },
+      {
+        headerName: "p99",
+        field: "cpu.p99",
+        filter: "agNumberColumnFilter",
         hide: true,
         valueFormatter: cpuFormatter,
       },
@@ -392,6 +445,7 @@ let columnDefs = [
         headerName: "Stdev",
         field: "cpu.stdev",
         filter: "agNumberColumnFilter",
+        tooltipValueGetter: confidenceTooltip,
         hide: true,
         valueFormatter: cpuFormatter,
       },
@@ -409,6 +463,173 @@ let columnDefs = [
       },
     ],
   },
+  {
+    headerName: "Network (MB/s)",
+    children: [
+      {
+        headerName: "Recv",
+        field: "net.recv",
+        filter: "agNumberColumnFilter",
+        valueFormatter: rateFormatter,
+      },
+      {
+        headerName: "Send",
+        field: "net.send",
+        filter: "agNumberColumnFilter",
+        valueFormatter: rateFormatter,
+      },
+      {
+        headerName: "Recv max",
+        field: "net.recv_max",
+        filter: "agNumberColumnFilter",
+        hide: true,
+        valueFormatter: rateFormatter,
+      },
+      {
+        headerName: "Send max",
+        field: "net.send_max",
+        filter: "agNumberColumnFilter",
+        hide: true,
+        valueFormatter: rateFormatter,
+      },
+    ],
+  },
+  {
+    headerName: "Disk (MB/s)",
+    children: [
+      {
+        headerName: "Read",
+        field: "disk.read",
+        filter: "agNumberColumnFilter",
+        hide: true,
+        valueFormatter: rateFormatter,
+      },
+      {
+        headerName: "Write",
+        field: "disk.write",
+        filter: "agNumberColumnFilter",
+        hide: true,
+        valueFormatter: rateFormatter,
+      },
+      {
+        headerName: "Read max",
+        field: "disk.read_max",
+        filter: "agNumberColumnFilter",
+        hide: true,
+        valueFormatter: rateFormatter,
+      },
+      {
+        headerName: "Write max",
+        field: "disk.write_max",
+        filter: "agNumberColumnFilter",
+        hide: true,
+        valueFormatter: rateFormatter,
+      },
+    ],
+  },
+  {
+    headerName: "Paging (MB/s)",
+    children: [
+      {
+        headerName: "In",
+        field: "paging.paged_in",
+        filter: "agNumberColumnFilter",
+        hide: true,
+        valueFormatter: rateFormatter,
+      },
+      {
+        headerName: "Out",
+        field: "paging.paged_out",
+        filter: "agNumberColumnFilter",
+        hide: true,
+        valueFormatter: rateFormatter,
+      },
+      {
+        headerName: "In max",
+        field: "paging.paged_in_max",
+        filter: "agNumberColumnFilter",
+        hide: true,
+        valueFormatter: rateFormatter,
+      },
+      {
+        headerName: "Out max",
+        field: "paging.paged_out_max",
+        filter: "agNumberColumnFilter",
+        hide: true,
+        valueFormatter: rateFormatter,
+      },
+    ],
+  },
+  {
+    headerName: "System (per second)",
+    children: [
+      {
+        headerName: "Context switches",
+        field: "system.context_switches",
+        filter: "agNumberColumnFilter",
+        valueFormatter: countFormatter,
+      },
+      {
+        headerName: "Interrupts",
+        field: "system.interrupts",
+        filter: "agNumberColumnFilter",
+        hide: true,
+        valueFormatter: countFormatter,
+      },
+      {
+        headerName: "Context switches max",
+        field: "system.context_switches_max",
+        filter: "agNumberColumnFilter",
+        hide: true,
+        valueFormatter: countFormatter,
+      },
+      {
+        headerName: "Interrupts max",
+        field: "system.interrupts_max",
+        filter: "agNumberColumnFilter",
+        hide: true,
+        valueFormatter: countFormatter,
+      },
+    ],
+  },
+  {
+    headerName: "CPU (per core)",
+    children: [
+      {
+        headerName: "Busiest",
+        field: "cores.busiest",
+        filter: "agNumberColumnFilter",
+        valueFormatter: cpuFormatter,
+      },
+      {
+        headerName: "Idlest",
+        field: "cores.idlest",
+        filter: "agNumberColumnFilter",
+        hide: true,
+        valueFormatter: cpuFormatter,
+      },
+      {
+        headerName: "Stdev",
+        field: "cores.stdev",
+        filter: "agNumberColumnFilter",
+        valueFormatter: cpuFormatter,
+      },
+      {
+        headerName: "Busiest max",
+        field: "cores.busiest_max",
+        filter: "agNumberColumnFilter",
+        hide: true,
+        valueFormatter: cpuFormatter,
+      },
+      {
+        headerName: "Cores",
+        field: "cores.count",
+        filter: "agNumberColumnFilter",
+        hide: true,
+        valueFormatter: countFormatter,
+      },
+    ],
+  },
   {
     headerName: "Meta",
     children: [
@@ -525,11 +746,40 @@ function latencyFormatter(params) {
 }
 
 function cpuFormatter(params) {
+  if (params.value == null) return "";
   let v = params.value;
   if (TFB_GRID.displayRounded) v = roundValue(v);
   return fOnePoint(v) + "%";
 }
 
+// the bootstrap interval of a mean, median or stdev, for runs processed
+// with --confidence
+function confidenceTooltip(params) {
+  let [group, statistic] = params.colDef.field.split(".");
+  let ci = params.data[group] && params.data[group].ci;
+  if (!ci || ci[statistic + "_low"] == null) return null;
+  let format = (value) => params.colDef.valueFormatter({ value: value });
+  return `95% interval ${format(ci[statistic + "_low"])} to ${format(
+    ci[statistic + "_high"]
+  )}`;
+}
+
+// network, disk and paging figures, missing for runs processed before they
+// were read from dstat
+function rateFormatter(params) {
+  if (params.value == null) return "";
+  let v = params.value;
+  if (TFB_GRID.displayRounded) v = roundValue(v);
+  return fTwoPoint(v);
+}
+
+function countFormatter(params) {
+  if (params.value == null) return "";
+  let v = params.value;
+  if (TFB_GRID.displayRounded) v = roundValue(v);
+  return fWhole(v);
+}
+
 function percentFormatter(params) {
   return fWhole(params.value) + "%";
 }
@@ -549,19 +799,21 @@ function PercentBarCellRenderer() {}
   let percentCellRenderer = function (params) {
     let value = params.value;
 
+    let minMaxes = window.TFB_GRID.minMaxes;
+    let maxOf = (path) => (minMaxes.columns[path] || [0, 0])[1];
     let maxThing = 0;
     if (params.colDef.field.indexOf("rps.") === 0)
-      maxThing = window.TFB_GRID.minMaxes.maxRps;
+      maxThing = maxOf("rps.requests_per_sec");
     else if (params.colDef.field.indexOf("latency.") === 0)
-      maxThing = window.TFB_GRID.minMaxes.meanLat90;
+      maxThing = minMaxes.mean_lat90;
     else if (params.colDef.field.indexOf("memory.") === 0)
-      maxThing = window.TFB_GRID.minMaxes.maxMem;
+      maxThing = maxOf("memory.max");
     else if (params.colDef.field.indexOf("usr.") === 0)
-      maxThing = window.TFB_GRID.minMaxes.maxUsr;
+      maxThing = maxOf("usr.max");
     else if (params.colDef.field.indexOf("sys.") === 0)
-      maxThing = window.TFB_GRID.minMaxes.maxSys;
+      maxThing = maxOf("sys.max");
     else if (params.colDef.field.indexOf("cpu.") === 0)
-      maxThing = window.TFB_GRID.minMaxes.maxCpu;
+      maxThing = maxOf("cpu.max");
 
     let percent = maxThing <= 0 ? 0 : (100 * value) / maxThing;
     let eDivPercentBarWrapper = document.createElement("div");
@@ -665,8 +917,8 @@ window.TFB_GRID = {
       let grid = TFB_GRID.gridOptions;
       let sortState = grid.columnApi.getColumnState();
       let filterState = grid.api.getFilterModel();
-      TFB_GRID.minMaxes = calculateMinMaxes(cached);
-      grid.api.setRowData(cached);
+      TFB_GRID.minMaxes = cached.minMaxes;
+      grid.api.setRowData(cached.rows);
       grid.api.refreshCells();
       grid.columnApi.applyColumnState({
         state: sortState,
@@ -703,20 +955,26 @@ window.TFB_GRID = {
     }
 
     function calculateMinMaxes(fetchedData) {
-      let maxRps = 0,
+      // the same scales as the "minmaxes" written by main.py
+      let paths = [
+        "rps.requests_per_sec",
+        "memory.max",
+        "usr.max",
+        "sys.max",
+        "cpu.max",
+      ];
+      let columns = {},
         sumLat90 = 0,
-        countLat90 = 0,
-        maxMem = 0,
-        maxCpu = 0,
-        maxSys = 0,
-        maxUsr = 0;
+        countLat90 = 0;
+      for (let path of paths) columns[path] = [0, 0];
       for (let i = 0; i < fetchedData.length; i++) {
         let fw = fetchedData[i];
-        if (fw.rps.requests_per_sec > maxRps) maxRps = fw.rps.requests_per_sec;
-        if (fw.memory.max > maxMem) maxMem = fw.memory.max;
-        if (fw.usr.max > maxUsr) maxUsr = fw.usr.max;
-        if (fw.sys.max > maxSys) maxSys = fw.sys.max;
-        if (fw.cpu.max > maxCpu) maxCpu = fw.cpu.max;
+        for (let path of paths) {
+          let [group, field] = path.split(".");
+          let value = fw[group][field];
+          if (value < columns[path][0]) columns[path][0] = value;
+          if (value > columns[path][1]) columns[path][1] = value;
+        }
         if (fw.latency.lat90 > 0) {
           countLat90 += 1;
           sumLat90 += fw.latency.lat90;
@@ -724,20 +982,46 @@ window.TFB_GRID = {
       }
 
       return {
-        maxRps: maxRps,
-        meanLat90: sumLat90 / countLat90,
-        maxMem: maxMem,
-        maxSys: maxSys,
-        maxUsr: maxUsr,
-        maxCpu: maxCpu,
+        columns: columns,
+        mean_lat90: sumLat90 / countLat90,
       };
     }
 
+    function fromColumnar(columnar) {
+      // one array per dotted field path, e.g. "rps.requests_per_sec"
+      let rows = [];
+      for (let i = 0; i < columnar.count; i++) rows.push({});
+      for (let [path, values] of Object.entries(columnar.columns)) {
+        let keys = path.split(".");
+        let last = keys.pop();
+        for (let i = 0; i < rows.length; i++) {
+          let target = rows[i];
+          for (let key of keys) {
+            if (!target[key]) target[key] = {};
+            target = target[key];
+          }
+          target[last] = values[i];
+        }
+      }
+      return rows;
+    }
+
     let response = await fetch(`${testrun}/${testtype}.json`);
     let fetchedData = await response.json();
-    await attachMeta(fetchedData);
-    TFB_GRID[key] = fetchedData;
-    TFB_GRID.minMaxes = calculateMinMaxes(fetchedData);
+    let rows, minMaxes;
+    if (Array.isArray(fetchedData)) {
+      // runs processed before main.py joined the metadata and min/max
+      rows = fetchedData;
+      await attachMeta(rows);
+      minMaxes = calculateMinMaxes(rows);
+    } else {
+      rows =
+        fetchedData.format === "columnar"
+          ? fromColumnar(fetchedData)
+          : fetchedData.rows;
+      minMaxes = fetchedData.minmaxes;
+    }
+    TFB_GRID[key] = { rows: rows, minMaxes: minMaxes };
     TFB_GRID.loadTable();
   },
 };
@@ -762,6 +1046,34 @@ async function setLanguageGithub() {
   window.getLanguageGithub = (lang) => window.LANGUAGE_GITHUB[lang];
 }
 
+async function addNewRuns() {
+  // runs processed since index.html was edited, e.g. by watch mode, are only
+  // listed in result_directories.json
+  let response = await fetch("result_directories.json", { cache: "no-cache" });
+  if (!response.ok) return;
+  let names = await response.json();
+
+  let select = document.getElementById("testrun");
+  // only names like the ones main.py gives downloaded runs can be labelled
+  // and placed by date, other names chosen on the command line are left out
+  let runPattern = /^([^_]+)_started(\d{4}-\d{2}-\d{2})_[^_]+$/;
+  let runDate = (name) => (name.match(runPattern) || [])[2] || "";
+  let existing = new Set(Array.from(select.options, (option) => option.value));
+  for (let name of names) {
+    let match = name.match(runPattern);
+    if (existing.has(name) || !match) continue;
+    let option = document.createElement("option");
+    option.value = name;
+    option.textContent = `${match[1]} ${match[2]}`;
+    // keep the runs newest first, and select the newest by default
+    let next = Array.from(select.options).find(
+      (o) => runDate(o.value) < runDate(name)
+    );
+    select.insertBefore(option, next || null);
+    if (select.options[0] === option) option.selected = true;
+  }
+}
+
 function applyUrlParams() {
   const url = new URL(window.location);
   const testrun = url.searchParams.get("testrun");
@@ -795,6 +1107,7 @@ document.addEventListener("DOMContentLoaded", async function () {
   new agGrid.Grid(gridDiv, TFB_GRID.gridOptions);
   await setLanguageColors();
   await setLanguageGithub();
+  await addNewRuns();
   applyUrlParams();
   TFB_GRID.changeRun();
 
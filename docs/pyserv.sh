@@ -1,3 +1,4 @@
 #!/bin/bash
 
-python3 -m http.server 8000
+# serve docs with precompressed files and cache headers, see --serve in main.py
+cd "$(dirname "$0")/.." && python3 main.py --serve=8000
@@ -1,643 +1,3489 @@
+import cProfile
+import gzip
+import hashlib
+import io
+import json
+import math
 import os
+import pstats
 import re
+import shutil
+import struct
 import sys
-from dataclasses import asdict, dataclass, is_dataclass
-from typing import Dict, List
-from urllib.parse import urlparse
-from urllib.request import urlopen
-from zipfile import ZipFile
+import threading
+import time
+import zlib
+from collections import deque
+from contextlib import closing, contextmanager, nullcontext
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from dataclasses import dataclass, fields, is_dataclass
+from functools import lru_cache, partial
+from http import HTTPStatus
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    get_args,
+    get_origin,
+)
+from http.client import HTTPConnection, HTTPException, HTTPSConnection, IncompleteRead
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError, URLError
+from urllib.parse import parse_qs, quote, urljoin, urlparse
+from urllib.request import Request, urlopen
+from zipfile import BadZipFile, ZipFile
 
+# pandas and pyparsing are imported by the few functions that use them, so
+# the command line and the core ingestion only need numpy
 import numpy as np
-import simplejson
-from pandas import DataFrame, read_csv
-from pyparsing import Combine, Group, Optional, Word, alphas, nums
+
+try:
+    import brotli
+except ImportError:  # optional, only used for the .br copies of the output
+    brotli = None
+
+try:
+    import resource
+except ImportError:  # not on Windows, the profile then has no peak memory
+    resource = None
 
 GuidPattern = "[0-9a-fA-F]{8}\-[0-9a-fA-F]{4}\-[0-9a-fA-F]{4}\-[0-9a-fA-F]{4}\-[0-9a-fA-F]{12}"  # noqa: W605, E501
-Integer = Word(nums)
-Floating = Combine(Word(nums) + Optional(Combine("." + Word(nums))))
-# FloatUnit: 12.34ms, 12.34k, or just 12.34
-FloatUnit = Group(Floating + Optional(Word(alphas)))
-Percent = Group(Floating + "%")
 
 
-class EnhancedJSONEncoder(simplejson.JSONEncoder):
+class EnhancedJSONEncoder(json.JSONEncoder):
     """
-    Extended JSON encoder to handle numpy types used in pandas.
+    Extended JSON encoder to handle numpy types and dataclasses, and to write
+    NaN and infinite floats as null.
     """
 
-    def default(self, o):
-        if isinstance(o, np.integer):
-            return int(o)
-        elif isinstance(o, np.floating):
-            if np.isnan(o) or np.isinf(o):
-                return None
-            return float(o)
-        elif isinstance(o, np.ndarray):
-            return o.tolist()
-        elif is_dataclass(o):
-            return asdict(o)
-        return super().default(o)
+    def iterencode(self, o, _one_shot=False):
+        return super().iterencode(to_plain(o), _one_shot)
+
+
+def to_plain(o):
+    """
+    Turn the dataclasses, numpy values and NaN or infinite floats in a value
+    into the plain types and None that the json module writes.
+    """
+    if isinstance(o, float):
+        return float(o) if math.isfinite(o) else None
+    elif o is None or isinstance(o, (str, int)):
+        return o
+    elif isinstance(o, dict):
+        return {k: to_plain(v) for k, v in o.items()}
+    elif isinstance(o, (list, tuple)):
+        return [to_plain(v) for v in o]
+    elif is_dataclass(o):
+        return to_row(o)
+    elif isinstance(o, np.integer):
+        return int(o)
+    elif isinstance(o, np.floating):
+        return to_plain(float(o))
+    elif isinstance(o, np.ndarray):
+        return to_plain(o.tolist())
+    return o
+
+
+def to_row(o) -> Dict:
+    """
+    A summary dataclass as the nested dicts the json module writes, read
+    straight from its fields. The summaries hold plain floats and ints, so
+    most values only need the check for NaN or infinity, which become None;
+    anything else goes through to_plain.
+    """
+    row = {}
+    for name in get_field_names(type(o)):
+        value = getattr(o, name)
+        if type(value) is float:
+            # NaN and infinities are the floats whose difference is not 0
+            if value - value != 0:
+                value = None
+        elif type(value) is not int and value is not None:
+            value = to_plain(value)
+        row[name] = value
+    return row
+
+
+@lru_cache(maxsize=None)
+def get_field_names(cls) -> Tuple[str, ...]:
+    return tuple(f.name for f in fields(cls))
+
+
+def with_slots(cls):
+    """
+    Rebuild a dataclass with __slots__ for its fields, like the slots=True
+    of Python 3.10 dataclasses, so its instances have no __dict__: they are
+    about half the size and their fields are faster to read.
+    """
+    names = get_field_names(cls)
+    namespace = {
+        key: value
+        for key, value in cls.__dict__.items()
+        if key not in names and key not in ("__dict__", "__weakref__")
+    }
+    namespace["__slots__"] = names
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
+
+
+@dataclass
+class Options(object):
+    jobs: int = 1  # worker processes used to parse framework results
+    parser: str = "fast"  # raw.txt parser: 'fast', 'pyparsing' or 'check'
+    force: bool = False  # parse everything even if the manifest has results
+    ramp_up: float = 1  # seconds skipped at the start of the dstat window
+    confidence: int = 0  # bootstrap resamples of the resource intervals, 0 for none
+    store: str = None  # directory to save the parsed dstat series into
+    from_store: str = None  # directory to summarize saved dstat series from
+    batch: bool = False  # the arguments list many runs to process together
+    batch_file: str = None  # file listing runs to process together
+    format: str = "json"  # output layout: 'json' rows or 'columnar' field arrays
+    compress: bool = False  # also write .gz and .br copies of the output
+    history: bool = False  # update the per-framework history shards
+    remote: bool = False  # fetch only the needed zip members with range requests
+    profile: str = None  # file to write the timing report to
+    profile_top: int = 10  # slowest units listed in the printed report
+    cprofile: str = None  # stage to run under cProfile while profiling
+    watch: float = None  # seconds between polls of the status page
+    watch_url: str = "https://tfb-status.techempower.com/"  # page listing runs
+    serve: int = None  # port to serve docs/ on
+    sqlite: str = None  # SQLite database to load every run's summaries into
+    api: int = None  # port to serve the query API over the SQLite database on
+    api_host: str = None  # interface the query API listens on, ApiHost if None
+    help: bool = False  # print the arguments and options and stop
+
 
+# Downloads running alongside the parsing of a batch
+BatchDownloads = 2
+# Seconds between saves of the manifest while parsing a run
+ManifestCheckpointSeconds = 30
+# Default seconds between polls of the status page in watch mode
+WatchSeconds = 600
+# Default port of the docs/ server
+ServePort = 8000
+# Cache-Control of the files of processed runs, which never change, and of
+# everything else, which is revalidated with its ETag
+ImmutableCacheControl = "public, max-age=31536000, immutable"
+RevalidateCacheControl = "no-cache"
+# Validators of a response and the request headers that send them back
+ConditionalHeaders = {"ETag": "If-None-Match", "Last-Modified": "If-Modified-Since"}
 
-def start(args):
+
+def start(args, options: Options = Options(), executor: Executor = None, record=True):
     for arg in args:
-        entry, name = arg
+        root, name = arg
         results_dir = f"docs/{name}"
         if not os.path.exists(results_dir):
             os.makedirs(results_dir)
 
         with open(f"{results_dir}/test_metadata.json", "w") as f:
-            with open(os.path.join(entry.path, "test_metadata.json"), "r") as mf:
+            with open_result_file(os.path.join(root, "test_metadata.json")) as mf:
                 f.write(mf.read())
 
-        test_files = get_test_result_files(entry.path)
-        test_results = get_test_results(test_files)
-        for testtype, results in test_results.items():
-            with open(f"{results_dir}/{testtype}.json", "w") as f:
-                print(f"Writing {results_dir}/{testtype}.json")
-                f.write(
-                    simplejson.dumps(results, cls=EnhancedJSONEncoder, ignore_nan=True)
-                )
-
-        record = "docs/result_directories.json"
-        if not os.path.isfile(record):
-            with open(record, "w") as f:
-                f.write("[]")
+        with timed("manifest"):
+            manifest = Manifest(
+                results_dir, options.ramp_up, options.confidence, not options.force
+            )
 
-        with open(record, "r+") as f:
-            content = f.read()
-            paths = simplejson.loads(content)
-            paths.append(name)
-            new_paths = simplejson.dumps(sorted(list(set(paths))))
-            f.seek(0)
-            f.write(new_paths)
-            f.truncate()
+        store_dir = None
+        if options.store:
+            # the store needs every framework's series, so nothing is reused
+            store_dir = os.path.join(options.store, name)
+            if not os.path.isdir(store_dir):
+                os.makedirs(store_dir)
+            with open(os.path.join(store_dir, "test_metadata.json"), "w") as f:
+                with open_result_file(os.path.join(root, "test_metadata.json")) as mf:
+                    f.write(mf.read())
 
+        print(f"Parsing results in {root}")
+        writer = TestResultsWriter(
+            results_dir,
+            sorted(AllowedTestTypes),
+            options.format,
+            options.compress,
+            get_framework_metadata(f"{results_dir}/test_metadata.json"),
+        )
+        store = SeriesStoreWriter(store_dir) if store_dir else nullcontext()
+        checkpointed = time.perf_counter()
+        with writer, store, manifest:
+            test_results = get_test_results(
+                get_test_result_files(root),
+                jobs=options.jobs,
+                parser=options.parser,
+                manifest=manifest,
+                ramp_up=options.ramp_up,
+                resamples=options.confidence,
+                store=store if store_dir else None,
+                executor=executor,
+            )
+            for testtype, summary in test_results:
+                if summary is not None:
+                    writer.add(testtype, summary)
+                # save the manifest now and then, so an interrupted run resumes
+                # from the frameworks parsed so far
+                if time.perf_counter() - checkpointed > ManifestCheckpointSeconds:
+                    with timed("manifest"):
+                        manifest.save()
+                    checkpointed = time.perf_counter()
+            with timed("manifest"):
+                manifest.commit()
+        if record:
+            record_result_directories([name])
 
-@dataclass
-class TestFiles(object):
-    verification: str = ""  # verification.txt
-    stats: str = ""  # stats.txt
-    raw: str = ""  # raw.txt
 
+def start_batch(targets: List[Tuple[str, str]], options: Options):
+    """
+    Process many runs, given as (url, None) or (path, name), in one go. The
+    downloads run in threads ahead of the parsing, which shares one process
+    pool across the runs, and result_directories.json is updated once.
+    """
+    from concurrent.futures import ProcessPoolExecutor
 
-def get_test_result_files(root: str) -> Dict[str, DataFrame]:
-    allowed_test_types = {
-        "db",
-        "fortune",
-        "json",
-        "plaintext",
-        "query",
-        "update",
-        "cached-query",
-    }
-    allowed_file_names = {"verification.txt", "stats.txt", "raw.txt"}
-    files = DataFrame(
-        (
-            (test, framework, file)
-            for framework in next(os.walk(root))[1]
-            for test in next(os.walk(os.path.join(root, framework)))[1]
-            if test in allowed_test_types
-            for file in next(os.walk(os.path.join(root, framework, test)))[2]
-            if file in allowed_file_names
-        ),
-        columns=["Test", "Framework", "File"],
-    )
+    names = []
+    executor = ProcessPoolExecutor(options.jobs) if options.jobs > 1 else None
+    if executor is not None:
+        # the workers are started on the first submit, fork them now rather
+        # than from a process already running the download threads
+        executor.submit(int).result()
+    try:
+        with ThreadPoolExecutor(max_workers=BatchDownloads) as downloads:
+            resolved = [
+                (
+                    downloads.submit(download_results, target, options.remote)
+                    if name is None
+                    else None
+                )
+                for target, name in targets
+            ]
+            for (target, name), download in zip(targets, resolved):
+                path = target
+                if download is not None:
+                    try:
+                        path, name = download.result()
+                    except (HTTPError, URLError, ValueError, BadZipFile) as err:
+                        print(f"Skipping {target}: {err}")
+                        continue
 
-    def to_test_files(fwGrp) -> TestFiles:
-        ver_path, stats_path, raw_path = "", "", ""
-        for index, row in fwGrp.iterrows():
-            fw, test, file = row["Framework"], row["Test"], row["File"]
-            if file == "verification.txt":
-                ver_path = os.path.join(root, fw, test, file)
-            elif file == "stats.txt":
-                stats_path = os.path.join(root, fw, test, file)
-            elif file == "raw.txt":
-                raw_path = os.path.join(root, fw, test, file)
-        return TestFiles(verification=ver_path, stats=stats_path, raw=raw_path)
+                if not is_results_dir(path):
+                    print(f"Skipping '{path}', it is not a directory or zip")
+                    continue
 
-    return {
-        test_type: files[files["Test"] == test_type]
-        .groupby("Framework")
-        .apply(to_test_files)
-        .reset_index(name="Files")
-        for test_type in allowed_test_types
-    }
+                try:
+                    roots = find_results_dirs(path)
+                    start([(d, name) for d in roots], options, executor, record=False)
+                except Exception as err:
+                    # like a failed download, one run must not stop the batch
+                    print(f"Skipping {target}, it could not be processed: {err!r}")
+                    continue
+                names.append(name)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        # the runs already written to docs are listed even if the batch stops
+        record_result_directories(names)
+    print(f"Processed {len(names)} of {len(targets)} runs")
 
 
-def get_verification(filename: str):
-    with open(filename, "r") as verFile:
-        for line in verFile:
-            if line.startswith("   PASS for"):
-                return True
-        return False
+def watch(options: Options):
+    """
+    Poll the status page and process every completed run newer than those in
+    result_directories.json, until interrupted. The page is requested with
+    the validators of its last response, so an unchanged page costs a 304.
+    """
+    print(f"Watching {options.watch_url} every {options.watch:g} seconds")
+    validators = {}
+    try:
+        while True:
+            try:
+                content = get_if_modified(options.watch_url, validators)
+                if content is not None:
+                    ingest_new_runs(options.watch_url, content, options)
+            except (HTTPException, OSError) as err:
+                print(f"Could not poll {options.watch_url}: {err}")
+            time.sleep(options.watch)
+    except KeyboardInterrupt:
+        print("Stopped watching")
 
 
-def get_rps_and_latency_parser():
-    count_conn = Group(
-        Integer.setResultsName("ThreadCount")
-        + "threads and"
-        + Integer.setResultsName("ConnectionCount")
-        + "connections;"
-    ).setResultsName("TestCounts")
-    lat_stats = Group(
-        "Latency"
-        + FloatUnit.setResultsName("Avg")
-        + FloatUnit.setResultsName("Stdev")
-        + FloatUnit.setResultsName("Max")
-        + Percent.setResultsName("StdevRange")
-        + ";"
-    ).setResultsName("LatencySummary")
-    rps_stats = Group(
-        "Req/Sec"
-        + FloatUnit.setResultsName("Avg")
-        + FloatUnit.setResultsName("Stdev")
-        + FloatUnit.setResultsName("Max")
-        + Percent.setResultsName("StdevRange")
-        + ";"
-    ).setResultsName("ReqSecSummary")
-    lat_dist_50 = Group("50%" + FloatUnit.setResultsName("Time") + ";").setResultsName(
-        "Latency50"
-    )
-    lat_dist_75 = Group("75%" + FloatUnit.setResultsName("Time") + ";").setResultsName(
-        "Latency75"
-    )
-    lat_dist_90 = Group("90%" + FloatUnit.setResultsName("Time") + ";").setResultsName(
-        "Latency90"
-    )
-    lat_dist_99 = Group("99%" + FloatUnit.setResultsName("Time") + ";").setResultsName(
-        "Latency99"
-    )
-    req_count = Group(
-        Integer.setResultsName("RequestCount")
-        + "requests in"
-        + FloatUnit.setResultsName("OverSeconds")
-        + ","
-        + FloatUnit.setResultsName("BytesRead")
-        + "read;"
-    ).setResultsName("OverTime")
-    non_2xx = Optional(
-        Group("Non-2xx or 3xx responses:" + Integer.setResultsName("Non2xxCount") + ";")
-    ).setResultsName("Non2xx")
-    socket_errors = Optional(
-        Group(
-            "Socket errors: connect"
-            + Integer.setResultsName("ConnectCount")
-            + ", read"
-            + Integer.setResultsName("ReadCount")
-            + ", write"
-            + Integer.setResultsName("WriteCount")
-            + ", timeout"
-            + Integer.setResultsName("TimeoutCount")
-            + ";"
-        )
-    ).setResultsName("SocketErrors")
-    rps_summary = Group(
-        "Requests/sec:" + Floating.setResultsName("RequestsPerSec") + ";"
-    ).setResultsName("ReqSecLine")
-    tps_summary = Group(
-        "Transfer/sec:" + FloatUnit.setResultsName("BytesReadPerSec") + ";"
-    ).setResultsName("BytesReadLine")
-    start_end = Group(
-        "STARTTIME"
-        + Integer.setResultsName("StartTime")
-        + ";"
-        + "ENDTIME"
-        + Integer.setResultsName("EndTime")
-        + ";"
-    ).setResultsName("StartEndTime")
-    parser = (
-        count_conn
-        + "Thread Stats   Avg      Stdev     Max   +/- Stdev;"
-        + lat_stats
-        + rps_stats
-        + "Latency Distribution;"
-        + lat_dist_50
-        + lat_dist_75
-        + lat_dist_90
-        + lat_dist_99
-        + req_count
-        + socket_errors
-        + non_2xx
-        + rps_summary
-        + tps_summary
-        + start_end
-    )
+def get_if_modified(url: str, validators: Dict[str, str]) -> str:
+    """
+    Get a page, or None if it did not change since the response the given
+    validators came from. The validators are updated from each new response.
+    """
+    headers = {ConditionalHeaders[name]: value for name, value in validators.items()}
+    try:
+        with urlopen(Request(url, headers=headers)) as response:
+            content = response.read().decode("utf-8")
+            validators.clear()
+            for name in ConditionalHeaders:
+                if response.headers.get(name):
+                    validators[name] = response.headers[name]
+            return content
+    except HTTPError as err:
+        if err.code == 304:
+            return None
+        raise
 
-    return parser
 
+def get_new_runs(url: str, content: str) -> List[str]:
+    """
+    The result pages linked from the status page, newest first, down to the
+    first run already in result_directories.json. When none of the listed
+    runs was processed yet, only the newest is returned; older runs are
+    backfilled with --batch instead.
+    """
+    known = set()
+    if os.path.isfile("docs/result_directories.json"):
+        with open("docs/result_directories.json", "r") as f:
+            known = set(re.findall(GuidPattern, f.read()))
 
-@dataclass
-class RpsSummary(object):
-    requests_per_sec: float = 0
-    transfer_megabytes_per_sec: int = 0
-    request_count: int = 0
-    megabytes_read: float = 0
-    over_seconds: float = 0
-    non_2xx_percent: float = 0
-    thread_rps_mean: float = 0
-    thread_rps_max: float = 0
-    thread_rps_stdev: float = 0
-    thread_rps_stdev_range: float = 0
-    socket_error_count: int = 0
+    runs = {}
+    for match in re.finditer(f'href="([^"]*results/({GuidPattern}))"', content):
+        runs.setdefault(match.group(2), urljoin(url, match.group(1)))
 
+    new_runs = []
+    for runid, run_url in runs.items():
+        if runid in known:
+            return new_runs
+        new_runs.append(run_url)
+    return new_runs[:1]
 
-@dataclass
-class LatencySummary(object):
-    lat50: float = 0
-    lat75: float = 0
-    lat90: float = 0
-    lat99: float = 0
-    thread_mean: float = 0
-    thread_max: float = 0
-    thread_stdev: float = 0
-    thread_stdev_range: float = 0
 
+def ingest_new_runs(url: str, content: str, options: Options):
+    """
+    Download and process the new runs listed on the status page, oldest
+    first. Runs still in progress have no results.zip yet and are checked
+    again when the page changes.
+    """
+    for run_url in reversed(get_new_runs(url, content)):
+        print(f"Found new run {run_url}")
+        try:
+            path, name = download_results(run_url, options.remote)
+        except (HTTPError, URLError, ValueError, BadZipFile) as err:
+            print(f"Skipping {run_url} for now: {err}")
+            continue
 
-@dataclass
-class MemorySummary(object):
-    mean: float = 0
-    median: float = 0
-    max: float = 0
-    stdev: float = 0
-    stdev_range: float = 0
+        try:
+            start([(d, name) for d in find_results_dirs(path)], options)
+            if options.history:
+                with timed("history"):
+                    update_history(compress=options.compress)
+            if options.sqlite:
+                with timed("sqlite"):
+                    update_sqlite(options.sqlite)
+        except Exception as err:
+            # a run that cannot be parsed must not stop the watch
+            print(f"Could not process {run_url}: {err!r}")
 
 
-@dataclass
-class CpuSummary(object):
-    mean: float = 0
-    median: float = 0
-    max: float = 0
-    stdev: float = 0
-    stdev_range: float = 0
+def start_from_store(name: str, options: Options):
+    """
+    Summarize a run again from its series store, e.g. with another ramp-up,
+    without reading its results.
+    """
+    store_dir = os.path.join(options.from_store, name)
+    results_dir = f"docs/{name}"
+    if not os.path.exists(results_dir):
+        os.makedirs(results_dir)
 
+    with open(f"{results_dir}/test_metadata.json", "w") as f:
+        with open(os.path.join(store_dir, "test_metadata.json"), "r") as mf:
+            f.write(mf.read())
 
-@dataclass
-class RawSummary(object):
-    threads: int = 0
-    connections: int = 0
-    rps: RpsSummary = None
-    latency: LatencySummary = None
-    starttime: float = 0
-    endtime: float = 0
+    testtypes = get_store_testtypes(store_dir)
+    metadata = get_framework_metadata(f"{results_dir}/test_metadata.json")
+    with TestResultsWriter(
+        results_dir, testtypes, options.format, options.compress, metadata
+    ) as writer:
+        for testtype, summary in get_store_results(
+            store_dir, options.ramp_up, options.confidence
+        ):
+            if summary is not None:
+                writer.add(testtype, summary)
+    record_result_directories([name])
 
 
-@dataclass
-class FrameworkSummary(object):
-    name: str = ""
-    threads: int = 0
-    connections: int = 0
-    rps: RpsSummary = None
-    latency: LatencySummary = None
-    memory: MemorySummary = None
-    cpu: CpuSummary = None
-    usr: CpuSummary = None
-    sys: CpuSummary = None
+# The test_metadata.json fields joined to every framework's summary
+MetaFields = [
+    "language",
+    "platform",
+    "webserver",
+    "classification",
+    "database",
+    "orm",
+    "framework",
+    "display_name",
+]
 
 
-def no_units(nums: List[str]) -> float:
+def get_framework_metadata(filename: str) -> Dict[str, Dict]:
     """
-    Remove unit annotations and convert to one scale.
-    Prefer milliseconds when given seconds (s) or microseconds (us).
-    Prefer megabytes when given kilobytes (KB) or gigabytes (GB).
-    Prefer 0-100 for percent.
+    The MetaFields of every framework in a run's test_metadata.json, and the
+    color of its language from docs/language_colors.json, keyed by name.
     """
-    if len(nums) == 0:
-        raise ValueError("nums must be non-empty list of str")
-    if len(nums) > 2:
-        raise ValueError("nums must have length less than 3")
-    if len(nums) == 1:
-        return float(nums[0])
+    with open(filename, "r") as f:
+        metadatas = json.load(f)
+    colors = {}
+    if os.path.isfile("docs/language_colors.json"):
+        with open("docs/language_colors.json", "r") as f:
+            colors = {k.lower(): v for k, v in json.load(f).items()}
 
-    num = float(nums[0])
-    unit = nums[1]
-    if unit == "%":
-        return num
-    elif unit == "k":
-        return num * 1e3
-    elif unit == "M":
-        return num * 1e6
-    elif unit == "GB":
-        return num * 1e3
-    elif unit == "MB":
-        return num  # prefer MB
-    elif unit == "KB":
-        return num * 1e-3
-    elif unit == "B":
-        return num * 1e-6
-    elif unit == "s":
-        return num * 1e3
-    elif unit == "ms":
-        return num  # prefer ms
-    elif unit == "us":
-        return num * 1e-3
-    else:
-        raise ValueError("Unknown unit: " + unit)
+    frameworks = {}
+    for metadata in metadatas:
+        meta = {field: metadata.get(field) for field in MetaFields}
+        meta["color"] = colors.get((meta["language"] or "").lower())
+        frameworks[metadata["name"]] = meta
+    return frameworks
 
 
-def get_rps_and_latency(filename: str) -> List[RawSummary]:
-    text_sections = {}
+class TestResultsWriter(object):
+    """
+    Write the summaries of each test type to '<testtype>.json', and with
+    compress to its '.gz' and '.br' copies, as the frameworks are summarized
+    rather than once the whole run is done. The files are written under
+    temporary names and each replaces the previous output when committed, so
+    an interrupted run leaves the previous output whole. Only the columnar
+    format keeps a test type's summaries until then, its arrays need them all.
+    Every summary gets the 'meta' of its framework from the given metadata,
+    and each file ends with the 'minmaxes' that scale the grid's percent bars.
+    """
 
-    # preprocess the raw.txt here into sections
-    with open(filename, "r") as rps_file:
-        section = 0
-        in_header = False
-        # the Multiple Query and Update tests use the 'Query: 20' sample
-        # the Cached Query test uses the 'Query: 100' sample
-        in_targeted_sample = False
-        in_targeted_sample_section = False
+    def __init__(
+        self,
+        results_dir: str,
+        testtypes: List[str],
+        output_format: str = "json",
+        compress: bool = False,
+        metadata: Dict[str, Dict] = None,
+    ):
+        self.results_dir = results_dir
+        self.output_format = output_format
+        self.compress = compress
+        self.metadata = metadata or {}
+        self.outputs: Dict[str, Dict] = {}
+        for testtype in testtypes:
+            self.open(testtype)
 
-        for line in rps_file:
-            line = line.strip()
-            if line.startswith("----"):
-                if in_header:
-                    in_header = False
-                    continue
-                in_header = True
-                section += 1
-                text_sections[section] = ""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        if error_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+    def open(self, testtype: str):
+        filename = f"{self.results_dir}/{testtype}.json"
+        sinks = [("", open(filename + ".tmp", "wb"), None, None)]
+        if self.compress:
+            # a gzip container without name or time, so unchanged output is
+            # byte identical
+            gz = zlib.compressobj(9, zlib.DEFLATED, 31)
+            sinks.append(
+                (".gz", open(filename + ".gz.tmp", "wb"), gz.compress, gz.flush)
+            )
+            if brotli is not None:
+                br = brotli.Compressor()
+                sinks.append(
+                    (".br", open(filename + ".br.tmp", "wb"), br.process, br.finish)
+                )
+        self.outputs[testtype] = {
+            "filename": filename,
+            "sinks": sinks,
+            "count": 0,
+            "results": [],
+            "ranges": {},
+            "lat90": [],
+        }
+
+    def add(self, testtype: str, summary: "FrameworkSummary"):
+        if testtype not in self.outputs:
+            self.open(testtype)
+        output = self.outputs[testtype]
+        output["count"] += 1
+        with timed("encode"):
+            row = to_row(summary)
+            row["meta"] = self.metadata.get(summary.name, {})
+            flat = flatten_fields(row)
+            update_ranges(output, flat)
+        if self.output_format == "columnar":
+            output["results"].append(flat)
+            return
+
+        with timed("encode"):
+            # to_row leaves only plain values, the C encoder writes them as is
+            content = json.dumps(row)
+        # the rows are streamed, the min/max follow them once all are known
+        self.write(output, (RowsPrefix if output["count"] == 1 else ", ") + content)
+
+    def write(self, output: Dict, content: str):
+        data = content.encode("utf-8")
+        with timed("write"):
+            for _, f, compress, _ in output["sinks"]:
+                f.write(compress(data) if compress else data)
+
+    def commit(self):
+        try:
+            while self.outputs:
+                # keep the output listed until its files are replaced, so it is
+                # cleaned up if that fails
+                testtype = next(iter(self.outputs))
+                self.commit_output(self.outputs[testtype])
+                del self.outputs[testtype]
+        except BaseException:
+            self.abort()
+            raise
+
+    def commit_output(self, output: Dict):
+        filename = output["filename"]
+        print(f"Writing {filename}")
+        minmaxes = get_minmaxes(output)
+        if self.output_format == "columnar":
+            with timed("encode"):
+                columnar = to_columnar(output["results"])
+                columnar["minmaxes"] = minmaxes
+                content = json.dumps(columnar, cls=EnhancedJSONEncoder)
+            self.write(output, content)
+        else:
+            with timed("encode"):
+                content = json.dumps(minmaxes, cls=EnhancedJSONEncoder)
+            prefix = "" if output["count"] else RowsPrefix
+            self.write(output, f'{prefix}], "minmaxes": {content}}}')
+
+        with timed("write"):
+            for extension, f, _, finish in output["sinks"]:
+                if finish:
+                    f.write(finish())
+                f.close()
+                os.replace(filename + extension + ".tmp", filename + extension)
+            if not self.compress:
+                # stale copies must not disagree with the file
+                write_compressed_copies(filename, b"", compress=False)
+
+    def abort(self):
+        for output in self.outputs.values():
+            for extension, f, _, _ in output["sinks"]:
+                f.close()
+                if os.path.isfile(output["filename"] + extension + ".tmp"):
+                    os.remove(output["filename"] + extension + ".tmp")
+        self.outputs = {}
+
+
+# Start of the rows output, which streams the rows before the min/max
+RowsPrefix = '{"format": "rows", "rows": ['
+
+
+def update_ranges(output: Dict, flat: Dict):
+    """
+    Widen the min/max of every numeric field of a test type's output with a
+    flattened summary row of plain values, where NaN and infinities are None,
+    and keep its 90th latency percentile if measured.
+    """
+    ranges = output["ranges"]
+    for name, value in flat.items():
+        if type(value) is not float and type(value) is not int:
+            continue
+        if name not in ranges:
+            ranges[name] = [value, value]
+        elif value < ranges[name][0]:
+            ranges[name][0] = value
+        elif value > ranges[name][1]:
+            ranges[name][1] = value
+    lat90 = flat.get("latency.lat90") or 0
+    if lat90 > 0:
+        output["lat90"].append(lat90)
+
+
+def get_minmaxes(output: Dict) -> Dict:
+    """
+    The [min, max] of every numeric field by dotted path, and the mean of the
+    measured 90th latency percentiles that scales the latency bars.
+    """
+    lat90 = output["lat90"]
+    return {
+        "columns": output["ranges"],
+        "mean_lat90": sum(lat90) / len(lat90) if lat90 else 0,
+    }
+
+
+# Significant digits kept for the floats of the columnar output
+ColumnarPrecision = 6
+
+
+def to_columnar(results: List) -> Dict:
+    """
+    Turn the summaries of a test type into one array per field, keyed by the
+    dotted field path used by the grid, e.g. 'rps.requests_per_sec', instead
+    of repeating every key in every row. Floats keep ColumnarPrecision digits.
+    """
+    rows = [flatten_fields(to_row(r) if is_dataclass(r) else r) for r in results]
+    names = {}
+    for row in rows:
+        names.update(dict.fromkeys(row))
+    columns = {name: [limit_precision(row.get(name)) for row in rows] for name in names}
+    return {"format": "columnar", "count": len(rows), "columns": columns}
+
+
+def flatten_fields(values: Dict, prefix: str = "") -> Dict:
+    flat = {}
+    for key, value in values.items():
+        if isinstance(value, dict):
+            flat.update(flatten_fields(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def limit_precision(value):
+    if isinstance(value, (float, np.floating)):
+        if not math.isfinite(value):
+            return None
+        return float(f"{value:.{ColumnarPrecision}g}")
+    if isinstance(value, list):
+        return [limit_precision(v) for v in value]
+    if isinstance(value, dict):
+        return {k: limit_precision(v) for k, v in value.items()}
+    return value
+
+
+def write_compressed_copies(filename: str, content: bytes, compress: bool):
+    """
+    Write '.gz' and, with the brotli package, '.br' copies next to the file
+    for servers that send precompressed files. Stale copies are removed when
+    not compressing, so they never disagree with the file.
+    """
+    copies = {".gz": None, ".br": None}
+    if compress:
+        # no name or time in the header, so unchanged output is byte identical
+        copies[".gz"] = gzip.compress(content, compresslevel=9, mtime=0)
+        if brotli is not None:
+            copies[".br"] = brotli.compress(content)
+
+    for extension, compressed in copies.items():
+        if compressed is not None:
+            with open(filename + extension, "wb") as f:
+                f.write(compressed)
+        elif os.path.isfile(filename + extension):
+            os.remove(filename + extension)
+
+
+# The fields kept for every run in the history shards
+HistoryFields = [
+    "threads",
+    "connections",
+    "rps.requests_per_sec",
+    "rps.non_2xx_percent",
+    "rps.socket_error_count",
+    "latency.lat50",
+    "latency.lat90",
+    "latency.lat99",
+    "memory.mean",
+    "memory.max",
+    "cpu.mean",
+    "usr.mean",
+    "sys.mean",
+]
+HistoryVersion = 1
+
+
+def update_history(docs_dir: str = "docs", compress: bool = False):
+    """
+    Update the history shards of every framework in '<docs_dir>/history', one
+    '<framework>.json' per framework with each test type's HistoryFields over
+    the runs of result_directories.json, oldest first. The index records the
+    files each run was read from, so only new, changed or removed runs are read
+    and only the shards of their frameworks are rewritten.
+    """
+    history_dir = os.path.join(docs_dir, "history")
+    if not os.path.isdir(history_dir):
+        os.makedirs(history_dir)
+
+    index_file = os.path.join(history_dir, "index.json")
+    index = {"version": HistoryVersion, "runs": {}}
+    if os.path.isfile(index_file):
+        with open(index_file, "r") as f:
+            index = json.load(f)
+        if index.get("version") != HistoryVersion:
+            index = {"version": HistoryVersion, "runs": {}}
+
+    with open(os.path.join(docs_dir, "result_directories.json"), "r") as f:
+        names = [n for n in json.load(f) if os.path.isdir(f"{docs_dir}/{n}")]
+
+    signatures = {name: get_run_signature(f"{docs_dir}/{name}") for name in names}
+    outdated = [
+        name
+        for name in list(index["runs"])
+        if index["runs"][name]["files"] != signatures.get(name)
+    ]
+    added = [n for n in names if n not in index["runs"] or n in outdated]
+    if not outdated and not added:
+        print("History is up to date")
+        return
+
+    # frameworks whose shards change: those of the old and new versions of a run
+    affected = set()
+    for name in outdated:
+        affected.update(index["runs"].pop(name)["frameworks"])
+
+    rows: Dict[str, Dict[str, Dict[str, Dict]]] = {}
+    for name in added:
+        frameworks = set()
+        for testtype in sorted(AllowedTestTypes):
+            filename = f"{docs_dir}/{name}/{testtype}.json"
+            if not os.path.isfile(filename):
                 continue
+            for row in read_test_results(filename):
+                framework = row["name"]
+                frameworks.add(framework)
+                values = {field: row.get(field) for field in HistoryFields}
+                rows.setdefault(framework, {}).setdefault(testtype, {})[name] = values
+        index["runs"][name] = {
+            "files": signatures[name],
+            "frameworks": sorted(frameworks),
+        }
+        affected.update(frameworks)
 
-            # ignore all query tests except the last 20-query one
-            if (
-                line.startswith("Running Primer query")
-                or line.startswith("Running Primer update")
-                or line.startswith("Running Primer cached-query")
-            ):
-                in_targeted_sample = True
-                in_targeted_sample_section = False
-            if in_targeted_sample:
-                if (
-                    line.startswith("Queries: 20 for query")
-                    or line.startswith("Queries: 20 for update")
-                    or line.startswith("Queries: 100 for cached-query")
-                ):
-                    in_targeted_sample_section = True
-                if not in_targeted_sample_section:
+    order = {name: get_run_order(name) for name in index["runs"]}
+    for framework in sorted(affected):
+        write_history_shard(
+            history_dir,
+            framework,
+            set(outdated),
+            rows.get(framework, {}),
+            order,
+            compress,
+        )
+
+    index["frameworks"] = sorted(
+        {fw for run in index["runs"].values() for fw in run["frameworks"]}
+    )
+    with open(index_file + ".tmp", "w") as f:
+        f.write(json.dumps(index))
+    os.replace(index_file + ".tmp", index_file)
+    print(
+        f"Updated the history of {len(affected)} frameworks"
+        + f" from {len(set(added) | set(outdated))} new, changed or removed runs"
+    )
+
+
+def get_run_signature(run_dir: str) -> Dict[str, List[int]]:
+    return {
+        testtype: get_file_signature(f"{run_dir}/{testtype}.json")
+        for testtype in sorted(AllowedTestTypes)
+        if os.path.isfile(f"{run_dir}/{testtype}.json")
+    }
+
+
+def get_run_order(name: str) -> Tuple[str, str]:
+    # run names look like 'Citrine_started2021-01-13_<id>'
+    match = re.search("started([0-9]{4}-[0-9]{2}-[0-9]{2})", name)
+    return (match.group(1) if match else "", name)
+
+
+def get_history_filename(history_dir: str, framework: str) -> str:
+    return os.path.join(
+        history_dir, re.sub("[^A-Za-z0-9_.-]", "_", framework) + ".json"
+    )
+
+
+def write_history_shard(
+    history_dir: str,
+    framework: str,
+    removed: set,
+    added: Dict[str, Dict[str, Dict]],
+    order: Dict[str, Tuple[str, str]],
+    compress: bool = False,
+):
+    """
+    Rewrite the shard of a framework without the removed runs and with the
+    added ones. A shard holds, per test type, the runs and one array per field.
+    """
+    filename = get_history_filename(history_dir, framework)
+    tests = {}
+    if os.path.isfile(filename):
+        with open(filename, "r") as f:
+            tests = json.load(f)["tests"]
+
+    merged = {}
+    for testtype in sorted(set(tests) | set(added)):
+        runs = {}
+        if testtype in tests:
+            recorded = tests[testtype]
+            for i, name in enumerate(recorded["runs"]):
+                if name not in removed:
+                    runs[name] = {f: recorded["fields"][f][i] for f in HistoryFields}
+        runs.update(added.get(testtype, {}))
+        if not runs:
+            continue
+
+        names = sorted(runs, key=lambda n: order[n])
+        merged[testtype] = {
+            "runs": names,
+            "fields": {
+                f: [limit_precision(runs[n][f]) for n in names] for f in HistoryFields
+            },
+        }
+
+    if not merged:
+        # the framework is in none of the runs anymore
+        if os.path.isfile(filename):
+            os.remove(filename)
+        write_compressed_copies(filename, b"", compress=False)
+        return
+
+    content = json.dumps(
+        {"framework": framework, "tests": merged}, cls=EnhancedJSONEncoder
+    )
+    with open(filename, "w") as f:
+        f.write(content)
+    write_compressed_copies(filename, content.encode("utf-8"), compress)
+
+
+def read_test_results(filename: str) -> List[Dict]:
+    """
+    Read the summaries of a test type as flat rows keyed by dotted field path,
+    from either output format.
+    """
+    with open(filename, "r") as f:
+        results = json.load(f)
+    if isinstance(results, dict) and results.get("format") == "columnar":
+        columns = results["columns"]
+        return [
+            {name: values[i] for name, values in columns.items()}
+            for i in range(results["count"])
+        ]
+    if isinstance(results, dict):
+        results = results["rows"]
+    return [flatten_fields(row) for row in results]
+
+
+# Bump when the tables of the SQLite store change, so it is built again
+SqliteVersion = 3
+# Default database of --sqlite, and port and interface of --api
+SqliteDatabase = "results.db"
+ApiPort = 8001
+ApiHost = "127.0.0.1"
+# Rows the query API returns when no limit is given, and at most
+ApiDefaultLimit = 100
+ApiMaxLimit = 1000
+# Efficiency columns the query API derives from the stored ones
+DerivedColumns = {
+    "rps_per_cpu": '"rps.requests_per_sec" / NULLIF("cpu.mean", 0)',
+    "rps_per_memory_mb": '"rps.requests_per_sec" / NULLIF("memory.mean", 0)',
+    "rps_per_connection": '"rps.requests_per_sec" / NULLIF("connections", 0)',
+}
+
+
+def get_sqlite_columns() -> Dict[str, str]:
+    """
+    The SQLite type of every numeric summary field, by the dotted path of the
+    output files, and of the joined metadata fields.
+    """
+    columns = {}
+
+    def add(cls, prefix: str):
+        for field in fields(cls):
+            if is_dataclass(field.type):
+                add(field.type, f"{prefix}{field.name}.")
+            elif field.type in (int, float):
+                kind = "INTEGER" if field.type is int else "REAL"
+                columns[f"{prefix}{field.name}"] = kind
+
+    add(FrameworkSummary, "")
+    for field in MetaFields + ["color"]:
+        columns[f"meta.{field}"] = "TEXT"
+    return columns
+
+
+def create_sqlite_tables(db, columns: Dict[str, str]):
+    """
+    Create the tables of the SQLite store, dropping those of another version.
+    """
+    db.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value)")
+    row = db.execute("SELECT value FROM info WHERE key = 'version'").fetchone()
+    if row is not None and row[0] == SqliteVersion:
+        return
+
+    db.execute("DROP TABLE IF EXISTS results")
+    db.execute("DROP TABLE IF EXISTS runs")
+    db.execute(
+        "CREATE TABLE runs (name TEXT PRIMARY KEY, environment TEXT, date TEXT,"
+        + " files TEXT)"
+    )
+    definitions = ", ".join(f'"{name}" {kind}' for name, kind in columns.items())
+    db.execute(
+        "CREATE TABLE results (run TEXT NOT NULL, testtype TEXT NOT NULL,"
+        + f" framework TEXT NOT NULL, {definitions},"
+        + " PRIMARY KEY (run, testtype, framework))"
+    )
+    db.execute("CREATE INDEX results_testtype ON results (testtype, framework)")
+    db.execute("CREATE INDEX runs_environment ON runs (environment, date)")
+    db.execute("INSERT OR REPLACE INTO info VALUES ('version', ?)", (SqliteVersion,))
+
+
+def update_sqlite(database: str, docs_dir: str = "docs"):
+    """
+    Load the summaries of every run of result_directories.json into the
+    SQLite store, one row per run, test type and framework. Like the history,
+    only new, changed or removed runs are read.
+    """
+    import sqlite3
+
+    with open(os.path.join(docs_dir, "result_directories.json"), "r") as f:
+        names = [n for n in json.load(f) if os.path.isdir(f"{docs_dir}/{n}")]
+    signatures = {
+        name: json.dumps(get_run_signature(f"{docs_dir}/{name}")) for name in names
+    }
+
+    columns = get_sqlite_columns()
+    insert = f"INSERT INTO results VALUES ({', '.join('?' * (len(columns) + 3))})"
+    with closing(sqlite3.connect(database)) as db, db:
+        create_sqlite_tables(db, columns)
+        recorded = dict(db.execute("SELECT name, files FROM runs"))
+        outdated = [n for n in recorded if recorded[n] != signatures.get(n)]
+        added = [n for n in names if n not in recorded or n in outdated]
+        for name in outdated:
+            db.execute("DELETE FROM results WHERE run = ?", (name,))
+            db.execute("DELETE FROM runs WHERE name = ?", (name,))
+
+        for name in added:
+            run_dir = f"{docs_dir}/{name}"
+            # runs processed before the metadata was joined into the output
+            metadata = {}
+            if os.path.isfile(f"{run_dir}/test_metadata.json"):
+                metadata = get_framework_metadata(f"{run_dir}/test_metadata.json")
+            for testtype in sorted(AllowedTestTypes):
+                filename = f"{run_dir}/{testtype}.json"
+                if not os.path.isfile(filename):
                     continue
+                rows = []
+                for row in read_test_results(filename):
+                    # fields the run was processed without are NULL
+                    meta = {
+                        f"meta.{k}": v for k, v in metadata.get(row["name"], {}).items()
+                    }
+                    values = [row.get(c, meta.get(c)) for c in columns]
+                    rows.append([name, testtype, row["name"]] + values)
+                db.executemany(insert, rows)
+            match = re.match("([^_]+)_started([0-9]{4}-[0-9]{2}-[0-9]{2})_", name)
+            environment, date = match.groups() if match else (None, None)
+            db.execute(
+                "INSERT INTO runs VALUES (?, ?, ?, ?)",
+                (name, environment, date, signatures[name]),
+            )
+
+    if outdated or added:
+        print(
+            f"Updated {database} from {len(set(added) | set(outdated))}"
+            + " new, changed or removed runs"
+        )
+    else:
+        print(f"{database} is up to date")
+
+
+def query_results(db, params: Dict[str, List[str]]) -> Dict:
+    """
+    Select summaries from the SQLite store by the query parameters of the
+    API: testtype, run and framework (each repeatable), environment and runs
+    (the last N runs, by date), <column>=value, min.<column> and max.<column>,
+    sort (comma separated, '-' first for descending), fields, limit and
+    offset. Columns are the dotted paths of the output files and the
+    DerivedColumns. Raises ValueError for unknown parameters or columns.
+    """
+    selectable = {"run": "run", "testtype": "testtype", "framework": "framework"}
+    selectable.update({c: f'"{c}"' for c in get_sqlite_columns()})
+    selectable.update(DerivedColumns)
+
+    def column(name: str) -> str:
+        if name not in selectable:
+            raise ValueError(f"Unknown column '{name}'")
+        return selectable[name]
+
+    where, args = [], []
+    for key, values in params.items():
+        if key in ("run", "testtype", "framework"):
+            where.append(f"{key} IN ({', '.join('?' * len(values))})")
+            args.extend(values)
+        elif key.startswith("min.") or key.startswith("max."):
+            operator = ">=" if key.startswith("min.") else "<="
+            where.append(f"{column(key[4:])} {operator} ?")
+            args.append(float(values[-1]))
+        elif key in selectable:
+            where.append(f"{selectable[key]} = ?")
+            args.append(values[-1])
+        elif key not in ("environment", "runs", "sort", "fields", "limit", "offset"):
+            raise ValueError(f"Unknown parameter '{key}'")
+
+    if "environment" in params or "runs" in params:
+        runs = "SELECT name FROM runs"
+        if "environment" in params:
+            runs += " WHERE environment = ?"
+            args.append(params["environment"][-1])
+        runs += " ORDER BY date DESC, name DESC"
+        if "runs" in params:
+            # SQLite reads a negative limit as no limit
+            count = int(params["runs"][-1])
+            if count < 1:
+                raise ValueError("runs must be at least 1")
+            runs += " LIMIT ?"
+            args.append(count)
+        where.append(f"run IN ({runs})")
+
+    order = []
+    for name in ",".join(params.get("sort", [])).split(","):
+        if name:
+            descending = name.startswith("-")
+            expression = column(name.lstrip("-"))
+            # missing values last either way
+            order.append(f"{expression} IS NULL, {expression}")
+            order[-1] += " DESC" if descending else ""
+
+    names = list(selectable)
+    if "fields" in params:
+        names = [n for n in ",".join(params["fields"]).split(",") if n]
+    expressions = ", ".join(column(n) for n in names)
+    # SQLite reads a negative limit as no limit
+    limit = int(params.get("limit", [ApiDefaultLimit])[-1])
+    limit = max(1, min(limit, ApiMaxLimit))
+    offset = int(params.get("offset", [0])[-1])
+    if offset < 0:
+        raise ValueError("offset must not be negative")
+
+    condition = f" WHERE {' AND '.join(where)}" if where else ""
+    count = db.execute(f"SELECT COUNT(*) FROM results{condition}", args).fetchone()[0]
+    rows = db.execute(
+        f"SELECT {expressions} FROM results{condition}"
+        + (f" ORDER BY {', '.join(order)}" if order else "")
+        + " LIMIT ? OFFSET ?",
+        args + [limit, offset],
+    ).fetchall()
+    return {
+        "count": count,
+        "offset": offset,
+        "limit": limit,
+        "rows": [dict(zip(names, row)) for row in rows],
+    }
+
+
+def answer_api_request(database: str, method: str, target: str) -> Tuple[int, Dict]:
+    """
+    The status and JSON body answering a request to the query API: /results
+    with the parameters of query_results, /runs and /columns.
+    """
+    import sqlite3
+
+    if method not in ("GET", "HEAD"):
+        return 405, {"error": f"Method {method} is not allowed"}
+    url = urlparse(target)
+    if url.path == "/columns":
+        return 200, {
+            "columns": list(get_sqlite_columns()),
+            "derived": list(DerivedColumns),
+        }
+    if url.path not in ("/results", "/runs"):
+        return 404, {"error": f"Not found: {url.path}"}
+    try:
+        # quoted, so '?', '#' or '%' in the path do not end it early
+        uri = f"file:{quote(os.path.abspath(database))}?mode=ro"
+        with closing(sqlite3.connect(uri, uri=True)) as db:
+            if url.path == "/runs":
+                runs = db.execute(
+                    "SELECT name, environment, date FROM runs ORDER BY date, name"
+                )
+                return 200, {
+                    "runs": [
+                        {"name": name, "environment": environment, "date": date}
+                        for name, environment, date in runs
+                    ]
+                }
+            return 200, query_results(db, parse_qs(url.query))
+    except ValueError as err:
+        return 400, {"error": str(err)}
+    except sqlite3.Error as err:
+        return 503, {"error": f"{database}: {err}"}
+
+
+async def handle_api_connection(database: str, reader, writer):
+    """
+    Answer the HTTP/1.1 requests of one connection to the query API until the
+    client closes it. The queries run in threads, off the event loop.
+    """
+    import asyncio
+
+    try:
+        while True:
+            try:
+                request = await reader.readline()
+                if not request.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+            except (ValueError, asyncio.LimitOverrunError):
+                # a line longer than the stream limit, the rest of the request
+                # cannot be told apart from the next one
+                await write_api_response(
+                    writer, 414, {"error": "Request line or header too long"}
+                )
+                break
+
+            parts = request.decode("latin-1").split()
+            if len(parts) == 3:
+                method, target, version = parts
+                # run_in_executor rather than asyncio.to_thread, new in 3.9
+                status, body = await asyncio.get_running_loop().run_in_executor(
+                    None, partial(answer_api_request, database, method, target)
+                )
+            else:
+                method, version = "GET", "HTTP/1.0"
+                status, body = 400, {"error": "Malformed request"}
+            keep_alive = version == "HTTP/1.1" and headers.get("connection") != "close"
+            await write_api_response(writer, status, body, method, keep_alive)
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def write_api_response(
+    writer, status: int, body: Dict, method: str = "GET", keep_alive: bool = False
+):
+    content = json.dumps(body, cls=EnhancedJSONEncoder).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+        + "Content-Type: application/json\r\n"
+        + f"Content-Length: {len(content)}\r\n"
+        + "Access-Control-Allow-Origin: *\r\n"
+        + f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode("latin-1") + (b"" if method == "HEAD" else content))
+    await writer.drain()
+
+
+def start_api(port: int, database: str, host: str = ApiHost):
+    """
+    Serve the query API over the SQLite database on the port of the host's
+    interface, only the local one by default, from an event loop in a
+    background thread.
+    """
+    import asyncio
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(
+        asyncio.start_server(
+            partial(handle_api_connection, database), host=host, port=port
+        )
+    )
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    print(f"Serving the query API over {database} at http://{host}:{port}/")
+
+
+def record_result_directories(names: List[str]):
+    record = "docs/result_directories.json"
+    if not os.path.isfile(record):
+        with open(record, "w") as f:
+            f.write("[]")
+
+    with open(record, "r+") as f:
+        content = f.read()
+        paths = json.loads(content)
+        paths.extend(names)
+        new_paths = json.dumps(sorted(list(set(paths))))
+        f.seek(0)
+        f.write(new_paths)
+        f.truncate()
+
+
+@dataclass
+class TestFiles(object):
+    verification: str = ""  # verification.txt
+    stats: str = ""  # stats.txt
+    raw: str = ""  # raw.txt
+
+
+def split_archive_path(path: str) -> Tuple[str, str]:
+    """
+    Split a path that points inside a zip, like 'cache/run.zip/results/x', into
+    the archive and the member name within it. Paths outside of an archive are
+    returned as ('', path).
+    """
+    parts = path.replace(os.sep, "/").split("/")
+    for i in range(1, len(parts) + 1):
+        prefix = "/".join(parts[:i])
+        if prefix.lower().endswith(".zip") and os.path.isfile(prefix):
+            return prefix, "/".join(p for p in parts[i:] if p)
+    return "", path
+
+
+def get_archive(archive: str) -> ZipFile:
+    # worker processes forked from the pool must not share the parent's file
+    # offset, so every process opens its own handle
+    return open_archive(archive, os.getpid())
+
+
+# bounded so a batch of many runs does not keep every zip open
+@lru_cache(maxsize=4)
+def open_archive(archive: str, pid: int) -> ZipFile:
+    return ZipFile(archive, "r")
+
+
+@lru_cache(maxsize=4)
+def get_archive_dirs(archive: str) -> Dict[str, List[str]]:
+    """
+    Index the directories of a zip from its central directory, mapping each
+    directory to its subdirectory names.
+    """
+    dirs = {"": set()}
+    for name in get_archive(archive).namelist():
+        parts = name.rstrip("/").split("/")
+        if not name.endswith("/"):
+            parts = parts[:-1]
+        for i in range(len(parts)):
+            parent = "/".join(parts[:i])
+            dirs.setdefault(parent, set()).add(parts[i])
+            dirs.setdefault("/".join(parts[: i + 1]), set())
+    return {d: sorted(subdirs) for d, subdirs in dirs.items()}
+
+
+def is_results_dir(path: str) -> bool:
+    archive, member = split_archive_path(path)
+    if archive:
+        return member in get_archive_dirs(archive)
+    return os.path.isdir(path)
+
+
+def list_results_dirs(path: str) -> List[str]:
+    archive, member = split_archive_path(path)
+    if archive:
+        return [os.path.join(path, d) for d in get_archive_dirs(archive)[member]]
+    return [d.path for d in os.scandir(path) if d.is_dir()]
+
+
+def result_file_exists(filename: str) -> bool:
+    archive, member = split_archive_path(filename)
+    if archive:
+        try:
+            get_archive(archive).getinfo(member)
+            return True
+        except KeyError:
+            return False
+    return os.path.exists(filename)
+
+
+def open_result_file(filename: str):
+    """
+    Open a results file for reading as text, streaming it out of the zip if
+    the path points inside one.
+    """
+    archive, member = split_archive_path(filename)
+    if archive:
+        return io.TextIOWrapper(get_archive(archive).open(member))
+    return open(filename, "r")
+
+
+AllowedTestTypes = {
+    "db",
+    "fortune",
+    "json",
+    "plaintext",
+    "query",
+    "update",
+    "cached-query",
+}
+# the result file names and the TestFiles field each one goes into
+AllowedFileNames = {
+    "verification.txt": "verification",
+    "stats.txt": "stats",
+    "raw.txt": "raw",
+}
+
+
+def get_test_result_files(root: str) -> Iterator[Tuple[str, str, TestFiles]]:
+    """
+    Lazily yield (test type, framework, files) for every test of every
+    framework in root, in framework name order, so parsing can start while
+    the rest of the tree is still being listed.
+    """
+    archive, prefix = split_archive_path(root)
+    if archive:
+        yield from get_archive_test_result_files(root, archive, prefix)
+        return
+
+    with os.scandir(root) as entries:
+        frameworks = sorted(e.name for e in entries if e.is_dir())
+    for framework in frameworks:
+        with os.scandir(os.path.join(root, framework)) as entries:
+            tests = sorted(
+                e.name for e in entries if e.name in AllowedTestTypes and e.is_dir()
+            )
+        for test in tests:
+            test_dir = os.path.join(root, framework, test)
+            files = TestFiles()
+            found = False
+            with os.scandir(test_dir) as entries:
+                for e in entries:
+                    if e.name in AllowedFileNames and not e.is_dir():
+                        setattr(files, AllowedFileNames[e.name], e.path)
+                        found = True
+            if found:
+                yield test, framework, files
+
+
+def get_archive_test_result_files(
+    root: str, archive: str, prefix: str
+) -> Iterator[Tuple[str, str, TestFiles]]:
+    # read the listing from the zip's central directory
+    prefix = prefix + "/" if prefix else ""
+    index: Dict[Tuple[str, str], TestFiles] = {}
+    for name in get_archive(archive).namelist():
+        if not name.startswith(prefix):
+            continue
+        parts = name[len(prefix) :].split("/")  # noqa: E203
+        if len(parts) != 3:
+            continue
+        framework, test, file = parts
+        if test in AllowedTestTypes and file in AllowedFileNames:
+            files = index.setdefault((framework, test), TestFiles())
+            setattr(files, AllowedFileNames[file], os.path.join(root, *parts))
+
+    for (framework, test), files in sorted(index.items()):
+        yield test, framework, files
+
+
+def get_verification(filename: str):
+    with open_result_file(filename) as verFile:
+        for line in verFile:
+            if line.startswith("   PASS for"):
+                return True
+        return False
+
+
+@lru_cache(maxsize=None)
+def get_rps_and_latency_parser():
+    from pyparsing import Combine, Group, Optional, Word, alphas, nums
+
+    Integer = Word(nums)
+    Floating = Combine(Word(nums) + Optional(Combine("." + Word(nums))))
+    # FloatUnit: 12.34ms, 12.34k, or just 12.34
+    FloatUnit = Group(Floating + Optional(Word(alphas)))
+    Percent = Group(Floating + "%")
+
+    count_conn = Group(
+        Integer.setResultsName("ThreadCount")
+        + "threads and"
+        + Integer.setResultsName("ConnectionCount")
+        + "connections;"
+    ).setResultsName("TestCounts")
+    lat_stats = Group(
+        "Latency"
+        + FloatUnit.setResultsName("Avg")
+        + FloatUnit.setResultsName("Stdev")
+        + FloatUnit.setResultsName("Max")
+        + Percent.setResultsName("StdevRange")
+        + ";"
+    ).setResultsName("LatencySummary")
+    rps_stats = Group(
+        "Req/Sec"
+        + FloatUnit.setResultsName("Avg")
+        + FloatUnit.setResultsName("Stdev")
+        + FloatUnit.setResultsName("Max")
+        + Percent.setResultsName("StdevRange")
+        + ";"
+    ).setResultsName("ReqSecSummary")
+    lat_dist_50 = Group("50%" + FloatUnit.setResultsName("Time") + ";").setResultsName(
+        "Latency50"
+    )
+    lat_dist_75 = Group("75%" + FloatUnit.setResultsName("Time") + ";").setResultsName(
+        "Latency75"
+    )
+    lat_dist_90 = Group("90%" + FloatUnit.setResultsName("Time") + ";").setResultsName(
+        "Latency90"
+    )
+    lat_dist_99 = Group("99%" + FloatUnit.setResultsName("Time") + ";").setResultsName(
+        "Latency99"
+    )
+    req_count = Group(
+        Integer.setResultsName("RequestCount")
+        + "requests in"
+        + FloatUnit.setResultsName("OverSeconds")
+        + ","
+        + FloatUnit.setResultsName("BytesRead")
+        + "read;"
+    ).setResultsName("OverTime")
+    non_2xx = Optional(
+        Group("Non-2xx or 3xx responses:" + Integer.setResultsName("Non2xxCount") + ";")
+    ).setResultsName("Non2xx")
+    socket_errors = Optional(
+        Group(
+            "Socket errors: connect"
+            + Integer.setResultsName("ConnectCount")
+            + ", read"
+            + Integer.setResultsName("ReadCount")
+            + ", write"
+            + Integer.setResultsName("WriteCount")
+            + ", timeout"
+            + Integer.setResultsName("TimeoutCount")
+            + ";"
+        )
+    ).setResultsName("SocketErrors")
+    rps_summary = Group(
+        "Requests/sec:" + Floating.setResultsName("RequestsPerSec") + ";"
+    ).setResultsName("ReqSecLine")
+    tps_summary = Group(
+        "Transfer/sec:" + FloatUnit.setResultsName("BytesReadPerSec") + ";"
+    ).setResultsName("BytesReadLine")
+    start_end = Group(
+        "STARTTIME"
+        + Integer.setResultsName("StartTime")
+        + ";"
+        + "ENDTIME"
+        + Integer.setResultsName("EndTime")
+        + ";"
+    ).setResultsName("StartEndTime")
+    parser = (
+        count_conn
+        + "Thread Stats   Avg      Stdev     Max   +/- Stdev;"
+        + lat_stats
+        + rps_stats
+        + "Latency Distribution;"
+        + lat_dist_50
+        + lat_dist_75
+        + lat_dist_90
+        + lat_dist_99
+        + req_count
+        + socket_errors
+        + non_2xx
+        + rps_summary
+        + tps_summary
+        + start_end
+    )
+
+    return parser
+
+
+@with_slots
+@dataclass
+class RpsSummary(object):
+    requests_per_sec: float = 0
+    transfer_megabytes_per_sec: int = 0
+    request_count: int = 0
+    megabytes_read: float = 0
+    over_seconds: float = 0
+    non_2xx_percent: float = 0
+    thread_rps_mean: float = 0
+    thread_rps_max: float = 0
+    thread_rps_stdev: float = 0
+    thread_rps_stdev_range: float = 0
+    socket_error_count: int = 0
+
+
+@with_slots
+@dataclass
+class LatencySummary(object):
+    lat50: float = 0
+    lat75: float = 0
+    lat90: float = 0
+    lat99: float = 0
+    thread_mean: float = 0
+    thread_max: float = 0
+    thread_stdev: float = 0
+    thread_stdev_range: float = 0
+
+
+@with_slots
+@dataclass
+class ConfidenceSummary(object):
+    mean_low: float = 0
+    mean_high: float = 0
+    median_low: float = 0
+    median_high: float = 0
+    stdev_low: float = 0
+    stdev_high: float = 0
+
+
+@with_slots
+@dataclass
+class MemorySummary(object):
+    mean: float = 0
+    median: float = 0
+    max: float = 0
+    stdev: float = 0
+    stdev_range: float = 0
+    ci: ConfidenceSummary = None  # with --confidence
+
+
+@with_slots
+@dataclass
+class CpuSummary(object):
+    mean: float = 0
+    median: float = 0
+    max: float = 0
+    p95: float = 0
+    p99: float = 0
+    stdev: float = 0
+    stdev_range: float = 0
+    ci: ConfidenceSummary = None  # with --confidence
+
+
+@with_slots
+@dataclass
+class NetworkSummary(object):
+    recv: float = 0  # mean MB/s
+    send: float = 0
+    recv_max: float = 0
+    send_max: float = 0
+
+
+@with_slots
+@dataclass
+class DiskSummary(object):
+    read: float = 0  # mean MB/s
+    write: float = 0
+    read_max: float = 0
+    write_max: float = 0
+
+
+@with_slots
+@dataclass
+class PagingSummary(object):
+    paged_in: float = 0  # mean MB/s
+    paged_out: float = 0
+    paged_in_max: float = 0
+    paged_out_max: float = 0
+
+
+@with_slots
+@dataclass
+class SystemSummary(object):
+    interrupts: float = 0  # mean per second
+    context_switches: float = 0
+    interrupts_max: float = 0
+    context_switches_max: float = 0
+
+
+@with_slots
+@dataclass
+class CoresSummary(object):
+    count: int = 0  # cores measured in the window
+    busiest: float = 0  # mean user + system percent of the busiest core
+    idlest: float = 0
+    stdev: float = 0  # of the mean percents of the cores
+    busiest_max: float = 0  # highest percent of any core
+
+
+@with_slots
+@dataclass
+class RawSummary(object):
+    threads: int = 0
+    connections: int = 0
+    rps: RpsSummary = None
+    latency: LatencySummary = None
+    starttime: float = 0
+    endtime: float = 0
+
+
+@with_slots
+@dataclass
+class LevelSummary(object):
+    threads: int = 0
+    connections: int = 0
+    requests_per_sec: float = 0
+    lat50: float = 0
+    lat90: float = 0
+    lat99: float = 0
+    memory: float = 0  # mean MB
+    memory_max: float = 0
+    cpu: float = 0  # mean percent
+    cpu_max: float = 0
+    usr: float = 0
+    sys: float = 0
+
+
+@with_slots
+@dataclass
+class FrameworkSummary(object):
+    name: str = ""
+    threads: int = 0
+    connections: int = 0
+    rps: RpsSummary = None
+    latency: LatencySummary = None
+    memory: MemorySummary = None
+    cpu: CpuSummary = None
+    usr: CpuSummary = None
+    sys: CpuSummary = None
+    net: NetworkSummary = None  # of the StatMetrics, None if dstat had none
+    disk: DiskSummary = None
+    paging: PagingSummary = None
+    system: SystemSummary = None
+    cores: CoresSummary = None
+    levels: List[LevelSummary] = None  # every measured section, in run order
+
+
+def no_units(nums: List[str]) -> float:
+    """
+    Remove unit annotations and convert to one scale.
+    Prefer milliseconds when given seconds (s) or microseconds (us).
+    Prefer megabytes when given kilobytes (KB) or gigabytes (GB).
+    Prefer 0-100 for percent.
+    """
+    if len(nums) == 0:
+        raise ValueError("nums must be non-empty list of str")
+    if len(nums) > 2:
+        raise ValueError("nums must have length less than 3")
+    if len(nums) == 1:
+        return float(nums[0])
+
+    num = float(nums[0])
+    unit = nums[1]
+    if unit == "%":
+        return num
+    elif unit == "k":
+        return num * 1e3
+    elif unit == "M":
+        return num * 1e6
+    elif unit == "GB":
+        return num * 1e3
+    elif unit == "MB":
+        return num  # prefer MB
+    elif unit == "KB":
+        return num * 1e-3
+    elif unit == "B":
+        return num * 1e-6
+    elif unit == "s":
+        return num * 1e3
+    elif unit == "ms":
+        return num  # prefer ms
+    elif unit == "us":
+        return num * 1e-3
+    else:
+        raise ValueError("Unknown unit: " + unit)
+
+
+def get_raw_sections(filename: str) -> List[List[str]]:
+    """
+    Split a wrk raw.txt into the lines of each measured section, or None if
+    the test failed.
+    """
+    text_sections = {}
+
+    # preprocess the raw.txt here into sections
+    with open_result_file(filename) as rps_file:
+        section = 0
+        in_header = False
+        # the Multiple Query and Update tests use the 'Query: 20' sample
+        # the Cached Query test uses the 'Query: 100' sample
+        in_targeted_sample = False
+        in_targeted_sample_section = False
+
+        for line in rps_file:
+            line = line.strip()
+            if line.startswith("----"):
+                if in_header:
+                    in_header = False
+                    continue
+                in_header = True
+                section += 1
+                text_sections[section] = []
+                continue
+
+            # ignore all query tests except the last 20-query one
+            if (
+                line.startswith("Running Primer query")
+                or line.startswith("Running Primer update")
+                or line.startswith("Running Primer cached-query")
+            ):
+                in_targeted_sample = True
+                in_targeted_sample_section = False
+            if in_targeted_sample:
+                if (
+                    line.startswith("Queries: 20 for query")
+                    or line.startswith("Queries: 20 for update")
+                    or line.startswith("Queries: 100 for cached-query")
+                ):
+                    in_targeted_sample_section = True
+                if not in_targeted_sample_section:
+                    continue
+
+            # ignore headers and 'Running' lines
+            if in_header or line.startswith("Running"):
+                continue
+
+            # throw out failed tests
+            if (
+                line.startswith("unable to connect to")
+                or line.startswith("0 requests")
+                or line.endswith("nan%")
+            ):
+                return None
+
+            text_sections[section].append(line)
+
+    # Warmup and primer don't have start/end time, so filter them out
+    return [
+        lines
+        for lines in text_sections.values()
+        if any("STARTTIME" in line for line in lines)
+    ]
+
+
+def parse_section_pyparsing(lines: List[str]) -> Dict[str, object]:
+    """
+    Parse the lines of one wrk section with the pyparsing grammar.
+    """
+    t = get_rps_and_latency_parser().parseString(
+        "".join(" " + line + ";\n" for line in lines)
+    )
+    tokens = {
+        "ThreadCount": t["TestCounts"]["ThreadCount"],
+        "ConnectionCount": t["TestCounts"]["ConnectionCount"],
+        "LatencyAvg": list(t["LatencySummary"]["Avg"]),
+        "LatencyStdev": list(t["LatencySummary"]["Stdev"]),
+        "LatencyMax": list(t["LatencySummary"]["Max"]),
+        "LatencyStdevRange": list(t["LatencySummary"]["StdevRange"]),
+        "ReqSecAvg": list(t["ReqSecSummary"]["Avg"]),
+        "ReqSecStdev": list(t["ReqSecSummary"]["Stdev"]),
+        "ReqSecMax": list(t["ReqSecSummary"]["Max"]),
+        "ReqSecStdevRange": list(t["ReqSecSummary"]["StdevRange"]),
+        "Latency50": list(t["Latency50"]["Time"]),
+        "Latency75": list(t["Latency75"]["Time"]),
+        "Latency90": list(t["Latency90"]["Time"]),
+        "Latency99": list(t["Latency99"]["Time"]),
+        "RequestCount": t["OverTime"]["RequestCount"],
+        "OverSeconds": list(t["OverTime"]["OverSeconds"]),
+        "BytesRead": list(t["OverTime"]["BytesRead"]),
+        "RequestsPerSec": t["ReqSecLine"]["RequestsPerSec"],
+        "BytesReadPerSec": list(t["BytesReadLine"]["BytesReadPerSec"]),
+        "StartTime": t["StartEndTime"]["StartTime"],
+        "EndTime": t["StartEndTime"]["EndTime"],
+    }
+    if "Non2xx" in t:
+        tokens["Non2xxCount"] = t["Non2xx"][0]["Non2xxCount"]
+    if "SocketErrors" in t:
+        serrs = t["SocketErrors"][0]
+        for key in ("ConnectCount", "ReadCount", "WriteCount", "TimeoutCount"):
+            tokens[key] = serrs[key]
+    return tokens
+
+
+FloatUnitPattern = r"([0-9]+(?:\.[0-9]+)?)\s*([a-zA-Z]*)"
+PercentPattern = r"([0-9]+(?:\.[0-9]+)?)\s*(%)"
+
+# Tokens captured with their unit, e.g. ['12.34', 'ms'], so the values go
+# through no_units() exactly as the pyparsing grammar's tokens do
+WrkUnitTokens = {
+    "LatencyAvg",
+    "LatencyStdev",
+    "LatencyMax",
+    "LatencyStdevRange",
+    "ReqSecAvg",
+    "ReqSecStdev",
+    "ReqSecMax",
+    "ReqSecStdevRange",
+    "Latency50",
+    "Latency75",
+    "Latency90",
+    "Latency99",
+    "OverSeconds",
+    "BytesRead",
+    "BytesReadPerSec",
+}
+
+# The lines of a wrk section in order: (token names, line pattern, optional)
+WrkSectionLines = [
+    (
+        ("ThreadCount", "ConnectionCount"),
+        re.compile(r"([0-9]+)\s+threads and\s+([0-9]+)\s+connections$"),
+        False,
+    ),
+    ((), re.compile(r"Thread Stats   Avg      Stdev     Max   \+/- Stdev$"), False),
+    (
+        ("LatencyAvg", "LatencyStdev", "LatencyMax", "LatencyStdevRange"),
+        re.compile(
+            r"Latency\s+"
+            + r"\s+".join([FloatUnitPattern] * 3)
+            + r"\s+"
+            + PercentPattern
+            + "$"
+        ),
+        False,
+    ),
+    (
+        ("ReqSecAvg", "ReqSecStdev", "ReqSecMax", "ReqSecStdevRange"),
+        re.compile(
+            r"Req/Sec\s+"
+            + r"\s+".join([FloatUnitPattern] * 3)
+            + r"\s+"
+            + PercentPattern
+            + "$"
+        ),
+        False,
+    ),
+    ((), re.compile(r"Latency Distribution$"), False),
+    (("Latency50",), re.compile(r"50%\s+" + FloatUnitPattern + "$"), False),
+    (("Latency75",), re.compile(r"75%\s+" + FloatUnitPattern + "$"), False),
+    (("Latency90",), re.compile(r"90%\s+" + FloatUnitPattern + "$"), False),
+    (("Latency99",), re.compile(r"99%\s+" + FloatUnitPattern + "$"), False),
+    (
+        ("RequestCount", "OverSeconds", "BytesRead"),
+        re.compile(
+            r"([0-9]+)\s+requests in\s+"
+            + FloatUnitPattern
+            + r"\s*,\s*"
+            + FloatUnitPattern
+            + r"\s+read$"
+        ),
+        False,
+    ),
+    (
+        ("ConnectCount", "ReadCount", "WriteCount", "TimeoutCount"),
+        re.compile(
+            r"Socket errors: connect\s+([0-9]+)\s*, read\s+([0-9]+)"
+            + r"\s*, write\s+([0-9]+)\s*, timeout\s+([0-9]+)$"
+        ),
+        True,
+    ),
+    (
+        ("Non2xxCount",),
+        re.compile(r"Non-2xx or 3xx responses:\s+([0-9]+)$"),
+        True,
+    ),
+    (
+        ("RequestsPerSec",),
+        re.compile(r"Requests/sec:\s+([0-9]+(?:\.[0-9]+)?)$"),
+        False,
+    ),
+    (
+        ("BytesReadPerSec",),
+        re.compile(r"Transfer/sec:\s+" + FloatUnitPattern + "$"),
+        False,
+    ),
+    (("StartTime",), re.compile(r"STARTTIME\s+([0-9]+)$"), False),
+    (("EndTime",), re.compile(r"ENDTIME\s+([0-9]+)$"), False),
+]
+
+
+def parse_section_fast(lines: List[str]) -> Dict[str, object]:
+    """
+    Parse the lines of one wrk section in a single pass with precompiled
+    regexes, producing the same tokens as parse_section_pyparsing.
+    """
+    tokens = {}
+    step = 0
+    for line in lines:
+        if step == len(WrkSectionLines):
+            break  # like the grammar, ignore anything after ENDTIME
+
+        while True:
+            if step == len(WrkSectionLines):
+                raise ValueError(f"Unexpected line '{line}'")
+            names, pattern, optional = WrkSectionLines[step]
+            match = pattern.match(line)
+            step += 1
+            if match:
+                break
+            if not optional:
+                raise ValueError(f"Unexpected line '{line}'")
+
+        groups = iter(match.groups())
+        for name in names:
+            value = next(groups)
+            if name in WrkUnitTokens:
+                unit = next(groups)
+                value = [value, unit] if unit else [value]
+            tokens[name] = value
+
+    if step < len(WrkSectionLines):
+        raise ValueError("Incomplete wrk section")
+    return tokens
+
+
+SectionParsers = {"pyparsing": parse_section_pyparsing, "fast": parse_section_fast}
+
+
+def get_rps_and_latency(filename: str, parser: str = "fast") -> List[RawSummary]:
+    sections = get_raw_sections(filename)
+    if sections is None:
+        return None
+
+    section_results = []
+    for lines in sections:
+        try:
+            if parser == "check":
+                t = parse_section_fast(lines)
+                expected = parse_section_pyparsing(lines)
+                if t != expected:
+                    raise ValueError(f"Parsers disagree: {t} != {expected}")
+            else:
+                t = SectionParsers[parser](lines)
+
+            threads = int(t["ThreadCount"])
+            connections = int(t["ConnectionCount"])
+            latavg = no_units(t["LatencyAvg"])
+            latstdev = no_units(t["LatencyStdev"])
+            latmax = no_units(t["LatencyMax"])
+            latstdevrange = no_units(t["LatencyStdevRange"])
+            rpsavg = no_units(t["ReqSecAvg"])
+            rpsstdev = no_units(t["ReqSecStdev"])
+            rpsmax = no_units(t["ReqSecMax"])
+            rpsstdevrange = no_units(t["ReqSecStdevRange"])
+            lat50 = no_units(t["Latency50"])
+            lat75 = no_units(t["Latency75"])
+            lat90 = no_units(t["Latency90"])
+            lat99 = no_units(t["Latency99"])
+            req_count = int(t["RequestCount"])
+            over_sec = 1e-3 * no_units(t["OverSeconds"])
+            mb_read = no_units(t["BytesRead"])
+            requests_per_sec = float(t["RequestsPerSec"])
+            megabytes_per_sec = no_units(t["BytesReadPerSec"])
+            starttime = float(t["StartTime"])
+            endtime = float(t["EndTime"])
+
+            non2xx = 0
+            if "Non2xxCount" in t:
+                non2xx = int(t["Non2xxCount"])
+
+            socket_error_count = 0
+            if "ConnectCount" in t:
+                socket_error_count = (
+                    int(t["ConnectCount"])
+                    + int(t["ReadCount"])
+                    + int(t["WriteCount"])
+                    + int(t["TimeoutCount"])
+                )
+
+            # throw out any tests with over 0.5% socket error
+            if socket_error_count > req_count * 0.005:
+                print(f"Too many socket errors for {filename}")
+                return None
+
+            rps = RpsSummary(
+                requests_per_sec=requests_per_sec,
+                transfer_megabytes_per_sec=megabytes_per_sec,
+                request_count=req_count,
+                megabytes_read=mb_read,
+                over_seconds=over_sec,
+                non_2xx_percent=100.0 * (non2xx / req_count),
+                thread_rps_mean=rpsavg,
+                thread_rps_max=rpsmax,
+                thread_rps_stdev=rpsstdev,
+                thread_rps_stdev_range=rpsstdevrange,
+                socket_error_count=socket_error_count,
+            )
+
+            latencies = LatencySummary(
+                lat50=lat50,
+                lat75=lat75,
+                lat90=lat90,
+                lat99=lat99,
+                thread_mean=latavg,
+                thread_max=latmax,
+                thread_stdev=latstdev,
+                thread_stdev_range=latstdevrange,
+            )
+
+            summary = RawSummary(
+                threads=threads,
+                connections=connections,
+                rps=rps,
+                latency=latencies,
+                starttime=starttime,
+                endtime=endtime,
+            )
+            section_results.append(summary)
+
+        except ValueError as verr:
+            raise ValueError("Problem parsing " + filename) from verr
+        except TypeError as terr:
+            raise TypeError("Problem parsing " + filename) from terr
+        except Exception as err:
+            print("\n".join(lines))
+            raise Exception("Problem parsing " + filename) from err
+
+    return section_results
+
+
+# The dstat columns summarized for every framework
+SummaryStatColumns = [
+    ("memory usage", "used"),
+    ("total cpu usage", "usr"),
+    ("total cpu usage", "sys"),
+]
+
+# The other dstat columns summarized, by (h1, h2) header: the FrameworkSummary
+# field and the field of its summary that get the window's mean, its max goes
+# to <field>_max, both divided by the scale (bytes to MB)
+StatMetrics = {
+    ("net/total", "recv"): ("net", "recv", 1e6),
+    ("net/total", "send"): ("net", "send", 1e6),
+    ("dsk/total", "read"): ("disk", "read", 1e6),
+    ("dsk/total", "writ"): ("disk", "write", 1e6),
+    ("paging", "in"): ("paging", "paged_in", 1e6),
+    ("paging", "out"): ("paging", "paged_out", 1e6),
+    ("system", "int"): ("system", "interrupts", 1),
+    ("system", "csw"): ("system", "context_switches", 1),
+}
+# The h1 of the per-core CPU columns, whose usr and sys go to the cores summary
+CoreStatPattern = "cpu([0-9]+) usage"
+
+
+def get_summary_stat_columns(names: List) -> List[Tuple[str, str]]:
+    """
+    The columns of a dstat file that are summarized: the SummaryStatColumns,
+    then those of the StatMetrics it has, then the usr and sys of each core.
+    """
+    present = set(names)
+    cores = sorted(
+        {
+            h1
+            for h1, h2 in names[1:]
+            if h2 == "usr" and re.fullmatch(CoreStatPattern, h1)
+        },
+        key=lambda h1: int(re.fullmatch(CoreStatPattern, h1).group(1)),
+    )
+    return (
+        SummaryStatColumns
+        + [column for column in StatMetrics if column in present]
+        + [(h1, h2) for h1 in cores for h2 in ("usr", "sys") if (h1, h2) in present]
+    )
+
+
+def read_stat_names(csv) -> List:
+    """
+    Read the information lines and the two header rows of a dstat CSV and
+    return the (h1, h2) name of every column, 'epoch' for the first. The
+    handle is left at the first row.
+    """
+    # Stats CSV has two headers after 4 information lines. Skip the four lines
+    # and parse the headers manually to use the double-key in our DataFrame.
+    for _ in range(4):
+        next(csv)
+    header1 = map(lambda x: x.strip('"'), csv.readline().strip().split(","))
+    header2 = map(lambda x: x.strip('"'), csv.readline().strip().split(","))
+
+    names = []
+    existing = set()  # Workaround duplicate header names that read_csv forbids
+    for h1, h2 in zip(header1, header2):
+        if h1:
+            lasth1 = h1
+            if (h1 + h2) in existing:
+                h2 += "+"
+            existing.add(h1 + h2)
+            names.append((h1, h2))
+        else:
+            if (lasth1 + h2) in existing:
+                h2 += "+"
+            existing.add(lasth1 + h2)
+            names.append((lasth1, h2))
+
+    names[0] = "epoch"
+    return names
+
+
+def read_stat_lines(csv, start: float = None, end: float = None) -> List[str]:
+    """
+    Read the rows with start <= epoch <= end from a dstat CSV handle.
+    """
+    # the epoch is sorted so stop reading at the first row past the end
+    rows = []
+    for line in csv:
+        comma = line.find(",")
+        if comma < 0:
+            continue
+        epoch = float(line[:comma])
+        if start is not None and epoch < start:
+            continue
+        if end is not None and epoch > end:
+            break
+        rows.append(line)
+    return rows
+
+
+def get_stats(
+    filename: str,
+    columns: List[Tuple[str, str]] = None,
+    start: float = None,
+    end: float = None,
+):
+    """
+    Pulls stats CSV into a DataFrame. Given (h1, h2) columns and an epoch
+    window, only those columns of the rows with start <= epoch <= end are read.
+    The summaries use get_summary_stat_rows instead, which does not need
+    pandas.
+    """
+    from pandas import DataFrame, MultiIndex, read_csv
+
+    with open_result_file(filename) as csv:
+        names = read_stat_names(csv)
+        if columns is None and start is None and end is None:
+            # the handle is positioned after the headers, read the rows from there
+            return read_csv(csv, names=names, index_col=[0])
+        rows = read_stat_lines(csv, start, end)
+
+    # read_csv returns the columns in file order, so sort the positions
+    positions = [0] + sorted(names.index(column) for column in (columns or names[1:]))
+    if not rows:
+        return DataFrame(
+            columns=MultiIndex.from_tuples([names[p] for p in positions[1:]])
+        )
+
+    stats = read_csv(
+        io.StringIO("".join(rows)),
+        header=None,
+        usecols=positions,
+        index_col=0,
+        dtype={p: np.float64 for p in positions[1:]},
+    )
+    stats.index.name = "epoch"
+    stats.columns = MultiIndex.from_tuples([names[p] for p in positions[1:]])
+    return stats
+
+
+def get_summary_stat_rows(
+    filename: str,
+    start: float = None,
+    end: float = None,
+    window: Tuple[float, float] = None,
+) -> Tuple[List[Tuple[str, str]], np.ndarray, np.ndarray]:
+    """
+    Read the epochs and the get_summary_stat_columns of the dstat rows with
+    start <= epoch <= end, as float64 arrays in file order, and return the
+    columns with them. Missing values are NaN, as read_csv reads them. Given
+    the (first, last) epochs of the window the StatMetrics are summarized
+    over, the columns after the SummaryStatColumns are only read in it, and
+    NaN elsewhere.
+    """
+    with open_result_file(filename) as csv:
+        names = read_stat_names(csv)
+        columns = get_summary_stat_columns(names)
+        index = {name: i for i, name in enumerate(names)}
+        positions = [index[column] for column in columns]
+        rows = read_stat_lines(csv, start, end)
+
+    cells = [line.split(",") for line in rows]
+    epoch = cells_to_float(cells, [0])[:, 0]
+    base = len(SummaryStatColumns)
+    if window is None:
+        return columns, epoch, cells_to_float(cells, positions)
+
+    values = np.full((len(rows), len(positions)), np.nan)
+    values[:, :base] = cells_to_float(cells, positions[:base])
+    lo = int(np.searchsorted(epoch, window[0], "left"))
+    hi = max(lo, int(np.searchsorted(epoch, window[1], "right")))
+    values[lo:hi, base:] = cells_to_float(cells[lo:hi], positions[base:])
+    return columns, epoch, values
+
+
+def cells_to_float(cells: List[List[str]], positions: List[int]) -> np.ndarray:
+    """
+    The cells at the given positions of split dstat CSV rows, as a float64
+    array with a column per position. NumPy converts the cells all at once,
+    unless a row is short or a cell is not a number, then each cell is
+    converted on its own and those are NaN.
+    """
+    try:
+        values = np.array(
+            [[row[p] for p in positions] for row in cells], dtype=np.float64
+        )
+        return values.reshape(len(cells), len(positions))
+    except (IndexError, ValueError):
+        pass
+
+    values = np.empty((len(cells), len(positions)), dtype=np.float64)
+    for i, row in enumerate(cells):
+        for j, position in enumerate(positions):
+            values[i, j] = to_float(row[position] if position < len(row) else "")
+    return values
+
+
+def to_float(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+def summarize_window(block: np.ndarray, statistics: Iterable[str]) -> Dict:
+    """
+    Compute the named statistics for every column of a window of dstat rows
+    in one batch. Statistics are 'mean', 'median', 'max', 'stdev',
+    'stdev_range' (percent of rows within one stdev of the mean) and
+    percentiles named like 'p95', which all come from a single sort.
+    Missing values are skipped like pandas does.
+    """
+    # keep each column contiguous so the sums match those of a pandas Series
+    block = np.asfortranarray(block, dtype=np.float64)
+    valid = ~np.isnan(block)
+    filled = np.asfortranarray(np.where(valid, block, 0))
+    count = valid.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = filled.sum(axis=0) / count
+        squares = np.asfortranarray(np.where(valid, (filled - mean) ** 2, 0))
+        stdev = np.where(count > 1, np.sqrt(squares.sum(axis=0) / (count - 1)), np.nan)
+
+    # missing values sort last, so each column's values are its first rows
+    ordered = np.sort(block, axis=0)
+    columns = np.arange(block.shape[1])
+
+    def at(rows):
+        return np.where(count > 0, ordered[np.maximum(rows, 0), columns], np.nan)
+
+    results = {}
+    for statistic in statistics:
+        if statistic == "mean":
+            results[statistic] = mean
+        elif statistic == "stdev":
+            results[statistic] = stdev
+        elif statistic == "stdev_range":
+            within = ((block >= mean - stdev) & (block <= mean + stdev)).sum(axis=0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                results[statistic] = 100 * within / count
+        elif statistic == "max":
+            results[statistic] = at(count - 1)
+        elif statistic == "median":
+            middle = count // 2
+            results[statistic] = np.where(
+                count % 2 == 1, at(middle), (at(middle - 1) + at(middle)) / 2
+            )
+        elif re.fullmatch("p[0-9]+", statistic):
+            position = (count - 1) * int(statistic[1:]) / 100
+            lower = np.floor(position).astype(int)
+            upper = np.minimum(lower + 1, count - 1)
+            results[statistic] = at(lower) + (position - lower) * (
+                at(upper) - at(lower)
+            )
+        else:
+            raise ValueError(f"Unknown statistic '{statistic}'")
+    return results
+
+
+# The summary fields that hold a level of the measured value, rather than its
+# spread, and so are converted to MB for memory, like the bounds of their
+# confidence intervals
+LevelStatistics = {"mean", "median", "max"}
+
+# The bootstrap of --confidence: the default resamples, the seed that makes the
+# intervals the same on every run, and the percent of resamples inside them
+BootstrapResamples = 1000
+BootstrapSeed = 20200317
+ConfidenceLevel = 95
+
+
+def to_summary(summary_type, statistics: Dict, column: int, scale: float = None):
+    """
+    Build a MemorySummary, CpuSummary or ConfidenceSummary from the statistics
+    of one column, given as lists of plain floats by column.
+    """
+    values = {}
+    for field in fields(summary_type):
+        if is_dataclass(field.type):
+            continue
+        value = statistics[field.name][column]
+        statistic = field.name.split("_")[0]
+        if scale and (
+            statistic in LevelStatistics or re.fullmatch("p[0-9]+", statistic)
+        ):
+            value = value / scale
+        values[field.name] = value
+    return summary_type(**values)
+
+
+@lru_cache(maxsize=64)
+def get_bootstrap_weights(rows: int, resamples: int) -> np.ndarray:
+    """
+    The times every resample draws each row of a window of the given rows,
+    as a (resamples, rows) array drawn from the fixed seed.
+    """
+    generator = np.random.default_rng(BootstrapSeed)
+    drawn = generator.integers(0, rows, size=(resamples, rows))
+    drawn += np.arange(resamples)[:, None] * rows
+    counts = np.bincount(drawn.ravel(), minlength=resamples * rows)
+    return counts.reshape(resamples, rows).astype(np.float64)
+
+
+def get_confidence_intervals(block: np.ndarray, resamples: int) -> Dict:
+    """
+    Bootstrap the mean, median and stdev of every column of a window. Rather
+    than copying the values of every resample, each resample is a row of
+    weights (the times it draws each row), so the statistics of all the
+    resamples and columns come from a few matrix products. The intervals are
+    the central ConfidenceLevel percent of each statistic's resampled values.
+    Missing values are skipped like summarize_window does.
+    """
+    rows, columns = block.shape
+    # (rows, resamples), so the sums below run over contiguous resamples
+    weights = get_bootstrap_weights(rows, resamples).T
+    valid = ~np.isnan(block)
+    # missing values are left out of every sum, and so never drawn
+    count = valid.T.astype(np.float64) @ weights
+
+    # centered on the window's mean so the sums of squares keep their precision
+    filled = np.where(valid, block, 0)
+    center = filled.sum(axis=0) / np.maximum(valid.sum(axis=0), 1)
+    centered = np.where(valid, filled - center, 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (centered.T @ weights) / count
+        squares = (centered.T**2) @ weights - count * mean**2
+        stdev = np.where(
+            count > 1, np.sqrt(np.maximum(squares, 0) / (count - 1)), np.nan
+        )
+
+    # the k-th smallest value a resample draws is the first of the sorted
+    # values whose cumulative weight passes k, missing values sort last
+    order = np.argsort(block, axis=0)
+    ordered = np.take_along_axis(block, order, axis=0)
+    drawn = weights[order] * valid[order, np.arange(columns)][:, :, None]
+    # the cumulative sums over the rows, as one product with a triangle
+    cumulative = (np.tri(rows) @ drawn.reshape(rows, -1)).reshape(drawn.shape)
+    total = count.astype(int)
+
+    def nth(k):
+        position = (cumulative <= k).sum(axis=0)
+        return ordered[np.minimum(position, rows - 1), np.arange(columns)[:, None]]
+
+    median = np.where(total > 0, (nth((total - 1) // 2) + nth(total // 2)) / 2, np.nan)
+
+    names = ["mean", "median", "stdev"]
+    # the bounds of every statistic and column from one percentile call
+    resampled = np.concatenate([mean + center[:, None], median, stdev])
+    tail = (100 - ConfidenceLevel) / 2
+    low, high = np.percentile(resampled, [tail, 100 - tail], axis=1)
+    intervals = {}
+    for i, name in enumerate(names):
+        bounds = slice(i * columns, (i + 1) * columns)
+        intervals[f"{name}_low"], intervals[f"{name}_high"] = low[bounds], high[bounds]
+    return intervals
+
+
+def get_resource_block(values: np.ndarray) -> np.ndarray:
+    """
+    The memory, user, system and total CPU columns of rows that start with the
+    SummaryStatColumns, as float64.
+    """
+    memory_usr_sys = np.asarray(values[:, : len(SummaryStatColumns)], dtype=np.float64)
+    return np.column_stack(
+        [memory_usr_sys, memory_usr_sys[:, 1] + memory_usr_sys[:, 2]]
+    )
+
+
+def get_resource_summaries(
+    values: np.ndarray, resamples: int = 0
+) -> Tuple[MemorySummary, CpuSummary, CpuSummary, CpuSummary]:
+    """
+    Summarize memory and total, user and system CPU of a window of rows of
+    the SummaryStatColumns, with bootstrap confidence intervals if resamples
+    are given.
+    """
+    block = get_resource_block(values)
+    names = {
+        f.name
+        for f in fields(MemorySummary) + fields(CpuSummary)
+        if not is_dataclass(f.type)
+    }
+    if len(block) == 0:
+        # no rows in the window, the resources are unknown
+        statistics = {name: [math.nan] * block.shape[1] for name in names}
+    else:
+        statistics = summarize_window(block, names)
+        # plain floats, converted from numpy once for all the columns
+        statistics = {name: values.tolist() for name, values in statistics.items()}
+    # memory usage is in bytes in the data, convert to MB after calculation by dividing
+    memory = to_summary(MemorySummary, statistics, 0, scale=1e6)
+    usr = to_summary(CpuSummary, statistics, 1)
+    sys = to_summary(CpuSummary, statistics, 2)
+    cpu = to_summary(CpuSummary, statistics, 3)
+    if resamples and len(block):
+        intervals = get_confidence_intervals(block, resamples)
+        intervals = {name: values.tolist() for name, values in intervals.items()}
+        memory.ci = to_summary(ConfidenceSummary, intervals, 0, scale=1e6)
+        usr.ci = to_summary(ConfidenceSummary, intervals, 1)
+        sys.ci = to_summary(ConfidenceSummary, intervals, 2)
+        cpu.ci = to_summary(ConfidenceSummary, intervals, 3)
+    return memory, cpu, usr, sys
+
+
+@lru_cache(maxsize=16)
+def get_metric_positions(
+    columns: Tuple[Tuple[str, str], ...],
+) -> Tuple[List[Tuple[Tuple[str, str], int]], List[int], List[int]]:
+    """
+    The StatMetrics among the columns with their positions, and the positions
+    of the usr and sys columns of each core.
+    """
+    positions = {column: i for i, column in enumerate(columns)}
+    metrics = [
+        (column, positions[column]) for column in StatMetrics if column in positions
+    ]
+    cores = [
+        h1
+        for h1, h2 in columns
+        if h2 == "usr"
+        and re.fullmatch(CoreStatPattern, h1)
+        and (h1, "sys") in positions
+    ]
+    usr = [positions[(h1, "usr")] for h1 in cores]
+    sys = [positions[(h1, "sys")] for h1 in cores]
+    return metrics, usr, sys
+
+
+def get_metric_summaries(
+    values: np.ndarray, columns: List[Tuple[str, str]]
+) -> Dict[str, object]:
+    """
+    Summarize the StatMetrics and the per-core CPU in a window of rows of the
+    given columns, with one summarize_window pass over all of them. Returns
+    the summaries by FrameworkSummary field, only those the columns have.
+    """
+    metrics, usr, sys = get_metric_positions(tuple(map(tuple, columns)))
+    if (not metrics and not usr) or len(values) == 0:
+        return {}
+    block = np.asarray(values, dtype=np.float64)
+    statistics = summarize_window(
+        np.column_stack(
+            [
+                block[:, [p for _, p in metrics]],
+                block[:, usr] + block[:, sys],
+            ]
+        ),
+        ["mean", "max"],
+    )
+    mean, peak = statistics["mean"].tolist(), statistics["max"].tolist()
+
+    types = {field.name: field.type for field in fields(FrameworkSummary)}
+    values_by_summary = {}
+    for i, (column, _) in enumerate(metrics):
+        summary, field, scale = StatMetrics[column]
+        if summary not in values_by_summary:
+            # a metric the file lacks is NaN rather than 0
+            values_by_summary[summary] = {
+                f.name: np.nan for f in fields(types[summary])
+            }
+        values_by_summary[summary][field] = mean[i] / scale
+        values_by_summary[summary][f"{field}_max"] = peak[i] / scale
+    summaries = {
+        summary: types[summary](**values)
+        for summary, values in values_by_summary.items()
+    }
+
+    # the mean and max user + system percent of each measured core
+    first = len(metrics)
+    busy, busy_max = [], []
+    for core_mean, core_max in zip(mean[first:], peak[first:]):
+        if not math.isnan(core_mean):
+            busy.append(core_mean)
+            busy_max.append(core_max)
+    if busy:
+        summaries["cores"] = CoresSummary(
+            count=len(busy),
+            busiest=max(busy),
+            idlest=min(busy),
+            # the sample stdev like summarize_window, NaN for a single core
+            stdev=float(np.std(busy, ddof=1)) if len(busy) > 1 else math.nan,
+            busiest_max=max(busy_max),
+        )
+    return summaries
+
+
+def get_window_bounds(
+    epoch: np.ndarray, rpslat: RawSummary, ramp_up: float = 1
+) -> Tuple[int, int]:
+    """
+    The first and past-the-end rows of a wrk section's dstat window, found by
+    binary search of the sorted epochs. The window starts ramp_up seconds into
+    the section to allow the framework to ramp up cpu/memory.
+    """
+    lo = int(np.searchsorted(epoch, rpslat.starttime + ramp_up, "left"))
+    hi = int(np.searchsorted(epoch, rpslat.endtime, "right"))
+    return lo, max(lo, hi)
+
+
+def get_level_summaries(
+    rpslats: List[RawSummary],
+    epoch: np.ndarray,
+    values: np.ndarray,
+    ramp_up: float = 1,
+) -> List[LevelSummary]:
+    """
+    Summarize every wrk section with the resources used in its window, for
+    the curves of throughput, latency, memory and CPU by concurrency level.
+    """
+    levels = []
+    for rpslat in rpslats:
+        lo, hi = get_window_bounds(epoch, rpslat, ramp_up)
+        if lo == hi:
+            # no dstat rows in the window, the resources are unknown
+            mean = peak = [math.nan] * 4
+        else:
+            statistics = summarize_window(
+                get_resource_block(values[lo:hi]), ["mean", "max"]
+            )
+            mean, peak = statistics["mean"].tolist(), statistics["max"].tolist()
+        levels.append(
+            LevelSummary(
+                threads=rpslat.threads,
+                connections=rpslat.connections,
+                requests_per_sec=rpslat.rps.requests_per_sec,
+                lat50=rpslat.latency.lat50,
+                lat90=rpslat.latency.lat90,
+                lat99=rpslat.latency.lat99,
+                memory=mean[0] / 1e6,
+                memory_max=peak[0] / 1e6,
+                cpu=mean[3],
+                cpu_max=peak[3],
+                usr=mean[1],
+                sys=mean[2],
+            )
+        )
+    return levels
+
+
+def get_framework_summary(
+    framework: str,
+    paths: TestFiles,
+    parser: str = "fast",
+    ramp_up: float = 1,
+    resamples: int = 0,
+) -> Optional[FrameworkSummary]:
+    """
+    Summarize one framework's results for one test type, or None if the test
+    failed verification or has no usable results.
+    """
+    rpslats = get_framework_rps_and_latency(paths, parser)
+    if rpslats is None:
+        return None
+
+    # Read the Dstat CSV once, only the rows from the first section to the
+    # last, and find each section's window in it
+    start = min(r.starttime for r in rpslats) + ramp_up
+    end = max(r.endtime for r in rpslats)
+    # the StatMetrics are summarized over the best section, read them only there
+    best = max(rpslats, key=lambda r: r.rps.requests_per_sec)
+    window = (best.starttime + ramp_up, best.endtime)
+    with timed("stats", paths.stats):
+        columns, epoch, values = get_summary_stat_rows(paths.stats, start, end, window)
+    with timed("aggregate"):
+        return summarize_framework(
+            framework, rpslats, epoch, values, ramp_up, resamples, columns
+        )
+
+
+def get_framework_rps_and_latency(paths: TestFiles, parser: str) -> List[RawSummary]:
+    with timed("verification", paths.verification):
+        if not get_verification(paths.verification):
+            return None
+        if not result_file_exists(paths.stats) or not result_file_exists(paths.raw):
+            return None
+
+    with timed("raw", paths.raw):
+        rpslats = get_rps_and_latency(paths.raw, parser)
+    if rpslats is None or len(rpslats) == 0:
+        return None
+    return rpslats
+
+
+def summarize_framework(
+    framework: str,
+    rpslats: List[RawSummary],
+    epoch: np.ndarray,
+    values: np.ndarray,
+    ramp_up: float = 1,
+    resamples: int = 0,
+    columns: List[Tuple[str, str]] = SummaryStatColumns,
+) -> Optional[FrameworkSummary]:
+    """
+    Summarize a framework from its wrk sections and its sorted dstat epochs
+    and rows of the given columns, which start with the SummaryStatColumns.
+    The top-level fields are those of the best section, the levels those of
+    every section. Given resamples, the resource summaries get bootstrap
+    confidence intervals. None if there are no dstat rows at all.
+    """
+    if len(epoch) == 0:
+        # no dstat rows at all, like an empty stats.txt
+        return None
+
+    # Get the best RPS result, a window without dstat rows leaves its
+    # resources NaN
+    rpslat = max(rpslats, key=lambda r: r.rps.requests_per_sec)
+    lo, hi = get_window_bounds(epoch, rpslat, ramp_up)
+
+    memory, cpu_total, cpu_usr, cpu_sys = get_resource_summaries(
+        values[lo:hi], resamples
+    )
+    return FrameworkSummary(
+        name=framework,
+        threads=rpslat.threads,
+        connections=rpslat.connections,
+        rps=rpslat.rps,
+        latency=rpslat.latency,
+        memory=memory,
+        cpu=cpu_total,
+        usr=cpu_usr,
+        sys=cpu_sys,
+        levels=get_level_summaries(rpslats, epoch, values, ramp_up),
+        **get_metric_summaries(values[lo:hi], columns),
+    )
+
+
+@dataclass
+class FrameworkSeries(object):
+    name: str = ""
+    sections: List[RawSummary] = None  # every measured wrk section
+    columns: List[Tuple[str, str]] = None  # of get_summary_stat_columns
+    epoch: np.ndarray = None  # float64 epoch of each dstat row
+    values: np.ndarray = None  # float32 rows of the columns
+
+
+def get_framework_series(
+    framework: str,
+    paths: TestFiles,
+    parser: str = "fast",
+    ramp_up: float = 1,
+    resamples: int = 0,
+) -> Optional[Tuple[FrameworkSummary, FrameworkSeries]]:
+    """
+    Like get_framework_summary, but also return the framework's wrk sections
+    and whole dstat capture for the series store.
+    """
+    rpslats = get_framework_rps_and_latency(paths, parser)
+    if rpslats is None:
+        return None
+
+    with timed("stats", paths.stats):
+        columns, epoch, values = get_summary_stat_rows(paths.stats)
+    with timed("aggregate"):
+        summary = summarize_framework(
+            framework, rpslats, epoch, values, ramp_up, resamples, columns
+        )
+    series = FrameworkSeries(
+        name=framework,
+        sections=rpslats,
+        columns=columns,
+        epoch=epoch,
+        values=values.astype(np.float32),
+    )
+    return summary, series
+
+
+def get_test_results(
+    testfiles: Iterable[Tuple[str, str, TestFiles]],
+    jobs: int = 1,
+    parser: str = "fast",
+    manifest: "Manifest" = None,
+    ramp_up: float = 1,
+    resamples: int = 0,
+    store: "SeriesStoreWriter" = None,
+    executor: Executor = None,
+) -> Iterator[Tuple[str, FrameworkSummary]]:
+    """
+    Summarize every framework of every test type as it is discovered, and
+    yield (test type, summary or None) in discovery order. With more than one
+    job the frameworks are parsed in a process pool, or in the given executor.
+    Given the manifest of a previous run, frameworks whose files are unchanged
+    reuse the recorded summary, and the manifest is updated as results come.
+    Given a store, every framework is parsed and its dstat series are added.
+    """
+    count = 0
+    frameworks = set()
+
+    def discovered():
+        nonlocal count
+        # discovery is lazy, so time each step of it
+        iterator = iter(testfiles)
+        while True:
+            with timed("discovery"):
+                unit = next(iterator, None)
+            if unit is None:
+                return
+            count += 1
+            frameworks.add(unit[1])
+            yield unit
+
+    if store is not None:
+        results = get_series_summaries(
+            store, manifest, discovered(), jobs, parser, ramp_up, resamples, executor
+        )
+    elif manifest is None:
+        results = imap_units(
+            get_framework_summary,
+            discovered(),
+            jobs,
+            parser,
+            ramp_up,
+            resamples,
+            executor,
+        )
+    else:
+        results = get_manifest_summaries(
+            manifest, discovered(), jobs, parser, ramp_up, resamples, executor
+        )
+
+    for (testtype, _, _), summary in results:
+        yield testtype, summary
+
+    print(f"Parsed {count} tests of {len(frameworks)} frameworks")
+
+
+def get_series_summaries(
+    store: "SeriesStoreWriter",
+    manifest: "Manifest",
+    units: Iterable[Tuple[str, str, TestFiles]],
+    jobs: int,
+    parser: str,
+    ramp_up: float = 1,
+    resamples: int = 0,
+    executor: Executor = None,
+) -> Iterator[Tuple[Tuple, FrameworkSummary]]:
+    """
+    Parse every unit, add its dstat series to the store and yield (unit,
+    summary), recording the summaries in the manifest if given.
+    """
+    seen = set()
+    for unit, result in imap_units(
+        get_framework_series, units, jobs, parser, ramp_up, resamples, executor
+    ):
+        testtype, framework, files = unit
+        summary = None
+        if result is not None:
+            summary, series = result
+            with timed("store"):
+                store.add(testtype, series)
+        if manifest is not None:
+            seen.add((testtype, framework))
+            manifest.record(unit, summary, get_unit_signature(files))
+        yield unit, summary
+
+    if manifest is not None:
+        manifest.prune(seen)
+
+
+# Bump when a change to the parsing or aggregation alters the summaries, so
+# incremental runs do not reuse summaries made by the older code
+ExtractionVersion = 6
+
+
+def get_file_signature(filename: str) -> List[int]:
+    """
+    Size and modification time of a file, or size and CRC of a zip member.
+    """
+    archive, member = split_archive_path(filename)
+    if archive:
+        try:
+            info = get_archive(archive).getinfo(member)
+        except KeyError:
+            return None
+        return [info.file_size, info.CRC]
+    if not os.path.isfile(filename):
+        return None
+    stat = os.stat(filename)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class Manifest(object):
+    """
+    The manifest of a run's output directory: the signatures of every unit's
+    input files, kept in memory, and the summaries made from them, which are
+    appended to a log as they come so memory does not grow with the run.
+    'manifest.json' has the signatures and the span of each summary in the log
+    'manifest.<generation>.jsonl.gz', a gzip member per summary: zcat reads
+    it as JSON lines, and any summary can be read alone. A manifest written by
+    a different extraction version, ramp-up or bootstrap is discarded. The log
+    is compacted into the next generation when summaries were replaced or
+    dropped, and manifest.json always names a log with all its summaries.
+    """
+
+    def __init__(
+        self,
+        results_dir: str,
+        ramp_up: float = 1,
+        resamples: int = 0,
+        reuse: bool = True,
+    ):
+        self.results_dir = results_dir
+        self.filename = os.path.join(results_dir, "manifest.json")
+        self.ramp_up = ramp_up
+        self.resamples = resamples
+        self.units: Dict[str, Dict[str, Dict]] = {}
+        self.log = None
+        if reuse:
+            self.load()
+        if self.log is None:
+            self.open_log(self.get_next_log())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        # commit is called once the run is complete, an interrupted run keeps
+        # its last checkpoint
+        self.log.close()
+
+    def load(self):
+        if not os.path.isfile(self.filename):
+            return
+        with open(self.filename, "r") as f:
+            manifest = json.load(f)
+        version, ramp_up = manifest.get("version"), manifest.get("ramp_up")
+        resamples, log = manifest.get("resamples", 0), manifest.get("log")
+        if version != ExtractionVersion:
+            print(f"Ignoring {self.filename} from extraction version {version}")
+        elif ramp_up != self.ramp_up:
+            print(f"Ignoring {self.filename} made with ramp-up {ramp_up}")
+        elif resamples != self.resamples:
+            print(f"Ignoring {self.filename} made with {resamples} resamples")
+        elif not log or not os.path.isfile(os.path.join(self.results_dir, log)):
+            print(f"Ignoring {self.filename}, its summaries are missing")
+        else:
+            self.units = manifest["units"]
+            self.open_log(log)
+
+    def get_next_log(self) -> str:
+        generations = [
+            int(match.group(1))
+            for match in (
+                re.fullmatch("manifest[.]([0-9]+)[.]jsonl[.]gz", e.name)
+                for e in os.scandir(self.results_dir)
+            )
+            if match
+        ]
+        return f"manifest.{max(generations, default=0) + 1}.jsonl.gz"
+
+    def open_log(self, name: str):
+        self.log_name = name
+        # new summaries go after those of the log, which stay where they are
+        self.log = open(os.path.join(self.results_dir, name), "a+b")
+        self.log.seek(0, os.SEEK_END)
+
+    def get_summary(
+        self, testtype: str, framework: str, signature: List
+    ) -> Tuple[bool, FrameworkSummary]:
+        """
+        Whether the unit is recorded with the same input files, and its
+        summary if so. A summary that cannot be read counts as not recorded.
+        """
+        entry = self.units.get(testtype, {}).get(framework)
+        if entry is None or entry["files"] != signature:
+            return False, None
+        if entry["summary"] is None:
+            return True, None
+        offset, length = entry["summary"]
+        try:
+            self.log.seek(offset)
+            record = zlib.decompress(self.log.read(length), 31)
+            summary = from_dict(FrameworkSummary, json.loads(record))
+        except (OSError, ValueError, zlib.error):
+            return False, None
+        finally:
+            self.log.seek(0, os.SEEK_END)
+        return True, summary
+
+    def record(self, unit: Tuple[str, str, TestFiles], summary, signature: List):
+        """
+        Record a unit's signature, appending its summary to the log.
+        """
+        testtype, framework, _ = unit
+        span = None
+        if summary is not None:
+            line = json.dumps(to_row(summary)) + "\n"
+            gz = zlib.compressobj(6, zlib.DEFLATED, 31)
+            data = gz.compress(line.encode("utf-8")) + gz.flush()
+            span = [self.log.tell(), len(data)]
+            self.log.write(data)
+        self.units.setdefault(testtype, {})[framework] = {
+            "files": signature,
+            "summary": span,
+        }
+
+    def prune(self, seen: set):
+        """
+        Drop the units that were not found in this run.
+        """
+        for testtype in list(self.units):
+            frameworks = self.units[testtype]
+            for framework in list(frameworks):
+                if (testtype, framework) not in seen:
+                    del frameworks[framework]
+            if not frameworks:
+                del self.units[testtype]
+
+    def save(self):
+        """
+        Write manifest.json for the summaries logged so far, so an interrupted
+        run resumes from them, and remove the logs it no longer names.
+        """
+        self.log.flush()
+        manifest = {
+            "version": ExtractionVersion,
+            "ramp_up": self.ramp_up,
+            "resamples": self.resamples,
+            "log": self.log_name,
+            "units": self.units,
+        }
+        with open(self.filename + ".tmp", "w") as f:
+            f.write(json.dumps(manifest))
+        os.replace(self.filename + ".tmp", self.filename)
+        for entry in os.scandir(self.results_dir):
+            if entry.name.startswith("manifest.") and entry.name.endswith(".gz"):
+                if entry.name != self.log_name:
+                    os.remove(entry.path)
+
+    def commit(self):
+        """
+        Save the manifest, first copying the summaries still recorded into the
+        next generation of the log if others were replaced or dropped.
+        """
+        spans = [
+            entry["summary"]
+            for frameworks in self.units.values()
+            for entry in frameworks.values()
+            if entry["summary"] is not None
+        ]
+        if sum(length for _, length in spans) < self.log.tell():
+            name = self.get_next_log()
+            with open(os.path.join(self.results_dir, name), "wb") as f:
+                for span in sorted(spans):
+                    self.log.seek(span[0])
+                    data = self.log.read(span[1])
+                    span[0] = f.tell()
+                    f.write(data)
+            self.log.close()
+            self.open_log(name)
+        self.save()
+
+
+def get_unit_signature(files: TestFiles) -> List:
+    return [get_file_signature(p) for p in (files.verification, files.raw, files.stats)]
+
+
+def get_manifest_summaries(
+    manifest: "Manifest",
+    units: Iterable[Tuple[str, str, TestFiles]],
+    jobs: int,
+    parser: str,
+    ramp_up: float = 1,
+    resamples: int = 0,
+    executor: Executor = None,
+) -> Iterator[Tuple[Tuple, FrameworkSummary]]:
+    """
+    Reuse the recorded summary of every unit whose input files match the
+    manifest, parse the rest, and yield (unit, summary) in order. The manifest
+    is updated as the units are yielded, and units no longer found are dropped
+    from it at the end.
+    """
+    # the signatures of the units being parsed, the reused ones stay recorded
+    signatures = {}
+    reused = 0
+
+    def checked_units():
+        nonlocal reused
+        for unit in units:
+            testtype, framework, files = unit
+            with timed("signature"):
+                signature = get_unit_signature(files)
+            recorded, summary = manifest.get_summary(testtype, framework, signature)
+            if recorded:
+                reused += 1
+                yield Reused(unit, summary)
+            else:
+                signatures[(testtype, framework)] = signature
+                yield unit
+
+    seen = set()
+    for unit, summary in imap_units(
+        get_framework_summary,
+        checked_units(),
+        jobs,
+        parser,
+        ramp_up,
+        resamples,
+        executor,
+    ):
+        key = (unit[0], unit[1])
+        seen.add(key)
+        if key in signatures:
+            manifest.record(unit, summary, signatures.pop(key))
+        yield unit, summary
+
+    manifest.prune(seen)
+    print(f"Reused {reused} unchanged results")
+
+
+def from_dict(cls, values: Dict):
+    """
+    Rebuild a (nested) summary dataclass from its JSON dictionary.
+    """
+    if values is None:
+        return None
+    kwargs = {}
+    for field in fields(cls):
+        if field.name not in values:
+            continue
+        value = values[field.name]
+        if is_dataclass(field.type):
+            value = from_dict(field.type, value)
+        elif get_origin(field.type) is list and value is not None:
+            (item_type,) = get_args(field.type)
+            if is_dataclass(item_type):
+                value = [from_dict(item_type, v) for v in value]
+        kwargs[field.name] = value
+    return cls(**kwargs)
+
+
+@dataclass
+class Reused(object):
+    """
+    A unit whose result is already known, passed through imap_units as is.
+    """
+
+    unit: Tuple[str, str, TestFiles]
+    result: object
+
+
+@dataclass
+class Pending(object):
+    """
+    A unit submitted to the executor of imap_units, not yet resolved.
+    """
+
+    unit: Tuple[str, str, TestFiles]
+    future: Future
+
+
+# Units in flight per job, this bounds the results waiting to be consumed
+UnitsPerJob = 8
+
+
+def imap_units(
+    function,
+    units: Iterable,
+    jobs: int,
+    parser: str = "fast",
+    ramp_up: float = 1,
+    resamples: int = 0,
+    executor: Executor = None,
+) -> Iterator[Tuple]:
+    """
+    Call function(framework, files, parser, ramp_up, resamples) for every
+    unit, in the given executor or a process pool when there is more than one
+    job, and yield (unit, result) in the order of the units. The units are
+    consumed lazily and at most UnitsPerJob per job are in flight, so memory
+    does not grow with the number of units. Reused units are yielded with their
+    result.
+    """
+    summarize = partial(
+        call_unit,
+        function,
+        parser=parser,
+        ramp_up=ramp_up,
+        resamples=resamples,
+        profile=Profile is not None,
+        cprofile_stage=Profile.cprofile_stage if Profile is not None else None,
+    )
+    if executor is None and jobs <= 1:
+        for unit in units:
+            if isinstance(unit, Reused):
+                yield unit.unit, unit.result
+            else:
+                yield unit, get_unit_result(summarize(unit))
+        return
+
+    if executor is None:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            yield from imap_units(
+                function, units, jobs, parser, ramp_up, resamples, executor
+            )
+        return
+
+    pending = deque()
+    for unit in units:
+        if not isinstance(unit, Reused):
+            unit = Pending(unit, executor.submit(summarize, unit))
+        pending.append(unit)
+        if len(pending) > UnitsPerJob * max(jobs, 1):
+            yield resolve_unit(pending.popleft())
+    while pending:
+        yield resolve_unit(pending.popleft())
+
+
+def resolve_unit(unit) -> Tuple:
+    # a Pending unit waits for its future, a Reused one already has its result
+    if isinstance(unit, Pending):
+        return unit.unit, get_unit_result(unit.future.result())
+    return unit.unit, unit.result
+
+
+def get_unit_result(result):
+    # while profiling, units return their timings with their result
+    if Profile is None:
+        return result
+    result, timings = result
+    Profile.add_unit(timings)
+    return result
+
+
+def call_unit(
+    function,
+    unit: Tuple[str, str, TestFiles],
+    parser: str,
+    ramp_up: float,
+    resamples: int = 0,
+    profile: bool = False,
+    cprofile_stage: str = None,
+):
+    testtype, framework, files = unit
+    if not profile:
+        return function(
+            framework, files, parser=parser, ramp_up=ramp_up, resamples=resamples
+        )
+
+    # time the unit on its own, in a worker or not, and return the timings
+    # with the result for the parent to add to its report
+    global Profile
+    outer, Profile = Profile, Profiler(cprofile_stage)
+    try:
+        result = function(
+            framework, files, parser=parser, ramp_up=ramp_up, resamples=resamples
+        )
+    finally:
+        unit_profile, Profile = Profile, outer
+    return result, unit_profile.get_unit_timings(testtype, framework)
+
+
+# The profiler of the process while --profile is given, else None
+Profile = None
+
+
+class Profiler(object):
+    """
+    Wall and CPU seconds, calls and bytes read or written per stage, and the
+    timings of every unit, for the --profile report. One stage can also be
+    run under cProfile.
+    """
+
+    def __init__(self, cprofile_stage: str = None):
+        self.stages: Dict[str, Dict] = {}
+        self.units: List[Dict] = []
+        self.cprofile_stage = cprofile_stage
+        self.cprofile = cProfile.Profile() if cprofile_stage else None
+        self.cprofile_stats = []
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+
+    @contextmanager
+    def stage(self, name: str, nbytes: int = 0):
+        profiled = name == self.cprofile_stage
+        if profiled:
+            self.cprofile.enable()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            if profiled:
+                self.cprofile.disable()
+            self.add_stage(name, 1, wall, cpu, nbytes)
+
+    def add_stage(self, name: str, calls: int, wall: float, cpu: float, nbytes: int):
+        stage = self.stages.setdefault(
+            name, {"calls": 0, "wall": 0.0, "cpu": 0.0, "bytes": 0}
+        )
+        stage["calls"] += calls
+        stage["wall"] += wall
+        stage["cpu"] += cpu
+        stage["bytes"] += nbytes
 
-            # ignore headers and 'Running' lines
-            if in_header or line.startswith("Running"):
-                continue
+    def get_unit_timings(self, testtype: str, framework: str) -> Dict:
+        timings = {
+            "testtype": testtype,
+            "framework": framework,
+            "wall": time.perf_counter() - self.wall,
+            "cpu": time.process_time() - self.cpu,
+            "bytes": sum(s["bytes"] for s in self.stages.values()),
+            "stages": self.stages,
+            "cprofile": None,
+        }
+        if self.cprofile is not None:
+            self.cprofile.create_stats()
+            timings["cprofile"] = self.cprofile.stats
+        return timings
 
-            # throw out failed tests
-            if (
-                line.startswith("unable to connect to")
-                or line.startswith("0 requests")
-                or line.endswith("nan%")
-            ):
-                return None
+    def add_unit(self, timings: Dict):
+        for name, stage in timings["stages"].items():
+            self.add_stage(
+                name, stage["calls"], stage["wall"], stage["cpu"], stage["bytes"]
+            )
+        if timings["cprofile"]:
+            self.cprofile_stats.append(timings["cprofile"])
+        unit = {k: v for k, v in timings.items() if k not in {"stages", "cprofile"}}
+        unit["stages"] = {k: v["wall"] for k, v in timings["stages"].items()}
+        self.units.append(unit)
 
-            text_sections[section] += " " + line + ";\n"
+    def get_report(self) -> Dict:
+        """
+        The report, with the stages of units summed over worker processes, so
+        their wall time can exceed the total.
+        """
+        report = {
+            "wall": time.perf_counter() - self.wall,
+            "cpu": time.process_time() - self.cpu,
+            "peak_rss_mb": None,
+            "peak_rss_workers_mb": None,
+            "stages": dict(sorted(self.stages.items())),
+            "units": sorted(self.units, key=lambda u: -u["wall"]),
+        }
+        if resource is not None:
+            # ru_maxrss is in kilobytes on Linux
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            workers = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+            report["peak_rss_mb"] = rss / 1e3
+            report["peak_rss_workers_mb"] = workers / 1e3
+        return report
 
-    rps_parser = get_rps_and_latency_parser()
-    section_results = []
-    for index, section in text_sections.items():
-        # Warmup and primer don't have start/end time, so filter them out
-        if "STARTTIME" not in section:
-            continue
-        try:
-            t = rps_parser.parseString(section)
-
-            threads = int(t["TestCounts"]["ThreadCount"])
-            connections = int(t["TestCounts"]["ConnectionCount"])
-            latavg = no_units(t["LatencySummary"]["Avg"])
-            latstdev = no_units(t["LatencySummary"]["Stdev"])
-            latmax = no_units(t["LatencySummary"]["Max"])
-            latstdevrange = no_units(t["LatencySummary"]["StdevRange"])
-            rpsavg = no_units(t["ReqSecSummary"]["Avg"])
-            rpsstdev = no_units(t["ReqSecSummary"]["Stdev"])
-            rpsmax = no_units(t["ReqSecSummary"]["Max"])
-            rpsstdevrange = no_units(t["ReqSecSummary"]["StdevRange"])
-            lat50 = no_units(t["Latency50"]["Time"])
-            lat75 = no_units(t["Latency75"]["Time"])
-            lat90 = no_units(t["Latency90"]["Time"])
-            lat99 = no_units(t["Latency99"]["Time"])
-            req_count = int(t["OverTime"]["RequestCount"])
-            over_sec = 1e-3 * no_units(t["OverTime"]["OverSeconds"])
-            mb_read = no_units(t["OverTime"]["BytesRead"])
-            requests_per_sec = float(t["ReqSecLine"]["RequestsPerSec"])
-            megabytes_per_sec = no_units(t["BytesReadLine"]["BytesReadPerSec"])
-            starttime = float(t["StartEndTime"]["StartTime"])
-            endtime = float(t["StartEndTime"]["EndTime"])
+    def get_cprofile_stats(self) -> pstats.Stats:
+        """
+        Join the cProfile statistics of this process and of every unit, or
+        None if the stage never ran.
+        """
+        self.cprofile.create_stats()
+        holders = [
+            StatsHolder(s) for s in [self.cprofile.stats] + self.cprofile_stats if s
+        ]
+        if not holders:
+            return None
+        return pstats.Stats(*holders)
 
-            non2xx = 0
-            if "Non2xx" in t:
-                non2xx = int(t["Non2xx"][0]["Non2xxCount"])
 
-            socket_error_count = 0
-            if "SocketErrors" in t:
-                serrs = t["SocketErrors"][0]
-                socket_error_count = (
-                    int(serrs["ConnectCount"])
-                    + int(serrs["ReadCount"])
-                    + int(serrs["WriteCount"])
-                    + int(serrs["TimeoutCount"])
-                )
+class StatsHolder(object):
+    """
+    The cProfile statistics of a unit, in the shape pstats.Stats loads.
+    """
 
-            # throw out any tests with over 0.5% socket error
-            if socket_error_count > req_count * 0.005:
-                print(f"Too many socket errors for {filename}")
-                return None
+    def __init__(self, stats: Dict):
+        self.stats = stats
 
-            rps = RpsSummary(
-                requests_per_sec=requests_per_sec,
-                transfer_megabytes_per_sec=megabytes_per_sec,
-                request_count=req_count,
-                megabytes_read=mb_read,
-                over_seconds=over_sec,
-                non_2xx_percent=100.0 * (non2xx / req_count),
-                thread_rps_mean=rpsavg,
-                thread_rps_max=rpsmax,
-                thread_rps_stdev=rpsstdev,
-                thread_rps_stdev_range=rpsstdevrange,
-                socket_error_count=socket_error_count,
-            )
+    def create_stats(self):
+        pass
 
-            latencies = LatencySummary(
-                lat50=lat50,
-                lat75=lat75,
-                lat90=lat90,
-                lat99=lat99,
-                thread_mean=latavg,
-                thread_max=latmax,
-                thread_stdev=latstdev,
-                thread_stdev_range=latstdevrange,
-            )
 
-            summary = RawSummary(
-                threads=threads,
-                connections=connections,
-                rps=rps,
-                latency=latencies,
-                starttime=starttime,
-                endtime=endtime,
-            )
-            section_results.append(summary)
+@contextmanager
+def timed(stage: str, filename: str = None):
+    """
+    Time a stage while profiling, counting the size of the given file as its
+    bytes. Does nothing otherwise.
+    """
+    if Profile is None:
+        yield
+        return
+    nbytes = 0
+    if filename:
+        signature = get_file_signature(filename)
+        nbytes = signature[0] if signature else 0
+    with Profile.stage(stage, nbytes):
+        yield
 
-        except ValueError as verr:
-            raise ValueError("Problem parsing " + filename) from verr
-        except TypeError as terr:
-            raise TypeError("Problem parsing " + filename) from terr
-        except Exception as err:
-            print(section)
-            raise Exception("Problem parsing " + filename) from err
 
-    return section_results
+def start_profile(options: Options):
+    global Profile
+    Profile = Profiler(options.cprofile)
 
 
-def get_stats(filename: str):
+def write_profile_report(options: Options):
     """
-    Pulls stats CSV into a DataFrame.
+    Write the JSON report and print the stages and the slowest units.
     """
-    # Stats CSV has two headers after 4 information lines. Skip the four lines
-    # and parse the headers manually to use the double-key in our DataFrame.
-    header1 = ""
-    header2 = ""
-    with open(filename, "r") as csv:
-        for _ in range(4):
-            next(csv)
-        header1 = map(lambda x: x.strip('"'), csv.readline().strip().split(","))
-        header2 = map(lambda x: x.strip('"'), csv.readline().strip().split(","))
+    report = Profile.get_report()
+    with open(options.profile, "w") as f:
+        f.write(json.dumps(report, indent=2))
+    print(f"Wrote profile to {options.profile}")
 
-    names = []
-    existing = [] # Workaround duplicate header names that read_csv forbids
-    for h1, h2 in zip(header1, header2):
-        if h1:
-            lasth1 = h1
-            if (h1 + h2) in existing:
-                h2 += "+";
-            existing.append(h1 + h2)
-            names.append((h1, h2))
-        else:
-            if (lasth1 + h2) in existing:
-                h2 += "+";
-            existing.append(lasth1 + h2)
-            names.append((lasth1, h2))
+    print(f"{'stage':<14}{'calls':>8}{'wall s':>10}{'cpu s':>10}{'MB':>10}")
+    for name, stage in report["stages"].items():
+        print(
+            f"{name:<14}{stage['calls']:>8}{stage['wall']:>10.3f}"
+            + f"{stage['cpu']:>10.3f}{stage['bytes'] / 1e6:>10.2f}"
+        )
+    print(f"{'total':<14}{'':>8}{report['wall']:>10.3f}{report['cpu']:>10.3f}")
+    if report["peak_rss_mb"] is not None:
+        print(
+            f"Peak RSS {report['peak_rss_mb']:.0f} MB,"
+            + f" {report['peak_rss_workers_mb']:.0f} MB in workers"
+        )
 
-    names[0] = "epoch"
-    return read_csv(filename, skiprows=6, names=names, index_col=[0])
+    print(f"Slowest {options.profile_top} units:")
+    for unit in report["units"][: options.profile_top]:
+        stages = ", ".join(f"{k} {v:.3f}" for k, v in unit["stages"].items())
+        print(
+            f"{unit['wall']:>8.3f}s {unit['testtype']:<13}{unit['framework']}"
+            + f" ({stages})"
+        )
 
+    if Profile.cprofile is not None:
+        filename = f"{options.profile}.{options.cprofile}.prof"
+        stats = Profile.get_cprofile_stats()
+        if stats is None:
+            print(f"The stage '{options.cprofile}' did not run, there is no cProfile")
+            return
+        stats.dump_stats(filename)
+        print(f"Wrote cProfile statistics of '{options.cprofile}' to {filename}")
+        stats.sort_stats("cumulative").print_stats(15)
 
-def get_memory_usage(stats: DataFrame):
-    memory = stats["memory usage", "used"]
-    mean = memory.mean()
-    stdev = memory.std()
-    # memory usage is in bytes in the data, convert to MB after calculation by dividing
-    return MemorySummary(
-        mean=mean / 1e6,
-        median=memory.median() / 1e6,
-        max=memory.max() / 1e6,
-        stdev=stdev,
-        stdev_range=100
-        * memory[memory.between(mean - stdev, mean + stdev)].count()
-        / memory.count(),
-    )
 
+class SeriesStoreWriter(object):
+    """
+    Save the dstat series of every framework as they come, one set of files
+    per test type: '<testtype>.epoch.npy' (float64) and '<testtype>.values.npy'
+    (float32) hold the rows of all frameworks back to back, and
+    '<testtype>.index.json' has the columns plus each framework's row offset,
+    row count and wrk sections. The rows go to temporary files and become the
+    .npy files on commit, so one framework's series is in memory at a time.
+    """
 
-def get_cpu(stats: DataFrame):
-    usr = stats["total cpu usage", "usr"]
-    sys = stats["total cpu usage", "sys"]
-    cpu = usr + sys
-    mean = cpu.mean()
-    stdev = cpu.std()
-    return CpuSummary(
-        mean=mean,
-        median=cpu.median(),
-        max=cpu.max(),
-        stdev=stdev,
-        stdev_range=100
-        * cpu[cpu.between(mean - stdev, mean + stdev)].count()
-        / cpu.count(),
-    )
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        if not os.path.isdir(store_dir):
+            os.makedirs(store_dir)
+        self.indexes: Dict[str, Dict] = {}
+        self.rows: Dict[str, int] = {}
+        self.files: Dict[str, Dict] = {}
 
+    def __enter__(self):
+        return self
 
-def get_cpu_usr(stats: DataFrame):
-    cpu = stats["total cpu usage", "usr"]
-    mean = cpu.mean()
-    stdev = cpu.std()
-    return CpuSummary(
-        mean=mean,
-        median=cpu.median(),
-        max=cpu.max(),
-        stdev=stdev,
-        stdev_range=100
-        * cpu[cpu.between(mean - stdev, mean + stdev)].count()
-        / cpu.count(),
-    )
+    def __exit__(self, error_type, error, traceback):
+        if error_type is None:
+            self.commit()
+        else:
+            self.abort()
 
+    def get_filename(self, testtype: str, name: str) -> str:
+        return os.path.join(self.store_dir, f"{testtype}.{name}.npy")
 
-def get_cpu_sys(stats: DataFrame):
-    cpu = stats["total cpu usage", "sys"]
-    mean = cpu.mean()
-    stdev = cpu.std()
-    return CpuSummary(
-        mean=mean,
-        median=cpu.median(),
-        max=cpu.max(),
-        stdev=stdev,
-        stdev_range=100
-        * cpu[cpu.between(mean - stdev, mean + stdev)].count()
-        / cpu.count(),
-    )
+    def add(self, testtype: str, series: FrameworkSeries):
+        if testtype not in self.indexes:
+            # the columns of the first framework, the dstat of a run is alike
+            self.indexes[testtype] = {"columns": series.columns, "frameworks": []}
+            self.rows[testtype] = 0
+            self.files[testtype] = {
+                name: open(self.get_filename(testtype, name) + ".tmp", "wb")
+                for name in ("epoch", "values")
+            }
 
+        rows = len(series.epoch)
+        self.indexes[testtype]["frameworks"].append(
+            {
+                "name": series.name,
+                "offset": self.rows[testtype],
+                "rows": rows,
+                "sections": series.sections,
+            }
+        )
+        self.rows[testtype] += rows
+        values = series.values
+        columns = self.indexes[testtype]["columns"]
+        if series.columns != columns:
+            # lay out the columns like the first framework's, NaN where missing
+            positions = {column: i for i, column in enumerate(series.columns)}
+            values = np.full((rows, len(columns)), np.nan, dtype=np.float32)
+            for i, column in enumerate(columns):
+                if column in positions:
+                    values[:, i] = series.values[:, positions[column]]
+        files = self.files[testtype]
+        np.ascontiguousarray(series.epoch, dtype=np.float64).tofile(files["epoch"])
+        np.ascontiguousarray(values, dtype=np.float32).tofile(files["values"])
 
-def get_test_results(
-    testdic: Dict[str, DataFrame]
-) -> Dict[str, List[FrameworkSummary]]:
-
-    testresults = {}
-    for testtype, frameworkframe in testdic.items():
-        testresults[testtype] = []
-        print(f"Parsing test type '{testtype}'")
-        for index, files in frameworkframe.iterrows():
-            framework, paths = files["Framework"], files["Files"]
-            if not get_verification(paths.verification):
-                continue
-            if not os.path.exists(paths.stats) or not os.path.exists(paths.raw):
-                continue
+    def commit(self):
+        for testtype, index in self.indexes.items():
+            print(f"Storing {self.store_dir}/{testtype} series")
+            rows = self.rows[testtype]
+            for name, dtype, shape in (
+                ("epoch", np.float64, (rows,)),
+                ("values", np.float32, (rows, len(index["columns"]))),
+            ):
+                # the rows are already laid out as in a .npy, prepend its header
+                filename = self.get_filename(testtype, name)
+                self.files[testtype][name].close()
+                with open(filename + ".tmp", "rb") as rows_file:
+                    with open(filename + ".new", "wb") as f:
+                        np.lib.format.write_array_header_1_0(
+                            f,
+                            {
+                                "descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                                "fortran_order": False,
+                                "shape": shape,
+                            },
+                        )
+                        shutil.copyfileobj(rows_file, f, 1 << 20)
+                os.replace(filename + ".new", filename)
+                os.remove(filename + ".tmp")
 
-            rpslats = get_rps_and_latency(paths.raw)
-            if rpslats is None or len(rpslats) == 0:
-                continue
+            with open(os.path.join(self.store_dir, f"{testtype}.index.json"), "w") as f:
+                f.write(json.dumps(index, cls=EnhancedJSONEncoder))
+        self.files = {}
 
-            # Get the best RPS result
-            rpslat = max(rpslats, key=lambda r: r.rps.requests_per_sec)
+    def abort(self):
+        for testtype, files in self.files.items():
+            for name, f in files.items():
+                f.close()
+                os.remove(self.get_filename(testtype, name) + ".tmp")
+        self.files = {}
 
-            # Get a DataFrame of the Dstat CSV
-            # Using only data from the fastest 15 second measurement
-            # Add one second to starttime to allow framework to ramp up cpu/memory
-            start, end = rpslat.starttime + 1, rpslat.endtime
-            statframe_try = get_stats(paths.stats)
-            if statframe_try.empty:
-                continue
 
-            statframe = statframe_try.loc[start:end]
-            memory = get_memory_usage(statframe)
-            cpu_usr = get_cpu_usr(statframe)
-            cpu_sys = get_cpu_sys(statframe)
-            cpu_total = get_cpu(statframe)
-            summary = FrameworkSummary(
-                name=framework,
-                threads=rpslat.threads,
-                connections=rpslat.connections,
-                rps=rpslat.rps,
-                latency=rpslat.latency,
-                memory=memory,
-                cpu=cpu_total,
-                usr=cpu_usr,
-                sys=cpu_sys,
-            )
-            testresults[testtype].append(summary)
+def get_store_testtypes(store_dir: str) -> List[str]:
+    return sorted(
+        entry.name[: -len(".index.json")]
+        for entry in os.scandir(store_dir)
+        if entry.name.endswith(".index.json")
+    )
+
+
+def get_store_results(
+    store_dir: str, ramp_up: float = 1, resamples: int = 0
+) -> Iterator[Tuple[str, FrameworkSummary]]:
+    """
+    Summarize every framework from a series store instead of the results, and
+    yield (test type, summary). The series are memory-mapped and only each
+    framework's window is read.
+    """
+    for testtype in get_store_testtypes(store_dir):
+        print(f"Summarizing test type '{testtype}' from {store_dir}")
+        with open(os.path.join(store_dir, f"{testtype}.index.json"), "r") as f:
+            index = json.load(f)
+        epoch = np.load(os.path.join(store_dir, f"{testtype}.epoch.npy"), mmap_mode="r")
+        values = np.load(
+            os.path.join(store_dir, f"{testtype}.values.npy"), mmap_mode="r"
+        )
 
-    return testresults
+        columns = [tuple(column) for column in index["columns"]]
+        for framework in index["frameworks"]:
+            rpslats = [from_dict(RawSummary, s) for s in framework["sections"]]
+            rows = slice(framework["offset"], framework["offset"] + framework["rows"])
+            # only the rows of the section windows are read from the mapping
+            yield testtype, summarize_framework(
+                framework["name"],
+                rpslats,
+                epoch[rows],
+                values[rows],
+                ramp_up,
+                resamples,
+                columns,
+            )
 
 
-def download_results(url):
+def download_results(url, remote: bool = False):
     """
     Download the results zip from the web, e.g. from
     https://tfb-status.techempower.com/results/5bc93dbb-7aa6-49a1-ab39-a2d36106beb9,
-    if it is not found already in 'cache/'.
+    if it is not found already in 'cache/'. When remote, only the zip members
+    that are parsed are fetched, if the server supports range requests.
     """
 
     content = urlopen(url).read().decode("utf-8")
@@ -686,62 +3532,697 @@ def download_results(url):
         print(f"Found existing downloaded results in {results_dir}")
         return (results_dir, name)
 
+    # the zip is read in place, there is no need to extract it
     results_zip = results_dir + ".zip"
-    print(f"Downloading {download_url} to {results_zip}")
-    download_zip = urlopen(download_url).read()
-    with open(results_zip, "wb") as rz:
-        rz.write(download_zip)
+    if os.path.isfile(results_zip):
+        print(f"Found existing downloaded results in {results_zip}")
+        return (results_zip, name)
 
-    # we have the zip, create the directory and expand data into it
     if not os.path.isdir("cache"):
         os.makedirs("cache")
-    if not os.path.isdir(results_dir):
-        os.makedirs(results_dir)
 
-    with ZipFile(results_zip, "r") as rz:
-        rz.extractall(results_dir)
+    if remote:
+        remote_zip = results_dir + ".remote.zip"
+        if os.path.isfile(remote_zip):
+            print(f"Found existing fetched results in {remote_zip}")
+            return (remote_zip, name)
+        print(f"Fetching the results in {download_url} to {remote_zip}")
+        with timed("download"):
+            if fetch_zip_members(download_url, remote_zip, is_result_member):
+                return (remote_zip, name)
+        print("The server does not support range requests, downloading the zip")
+
+    print(f"Downloading {download_url} to {results_zip}")
+    with timed("download"):
+        download_file(download_url, results_zip)
+    return (results_zip, name)
+
+
+def download_file(url: str, filename: str, retries: int = 5, chunk_size: int = 1 << 20):
+    """
+    Stream a zip from url into filename in fixed size chunks. The data goes to
+    '<filename>.part' first, an interrupted download resumes from there with an
+    HTTP Range request, and the zip is verified before it is renamed into place.
+    """
+    part_file = filename + ".part"
+    attempt = 0
+    while True:
+        done = os.path.getsize(part_file) if os.path.isfile(part_file) else 0
+        request = Request(url)
+        if done:
+            request.add_header("Range", f"bytes={done}-")
+
+        try:
+            with urlopen(request, timeout=60) as response:
+                if done and response.status != 206:
+                    print("Server does not support resuming, starting over")
+                    done = 0
+
+                # Content-Range is 'bytes start-end/total' on a resumed request
+                content_range = response.headers.get("Content-Range", "")
+                length = response.headers.get("Content-Length")
+                total = None
+                if done and "/" in content_range:
+                    total = int(content_range.rsplit("/", 1)[1])
+                elif length is not None:
+                    total = done + int(length)
+
+                with open(part_file, "ab" if done else "wb") as f:
+                    done = copy_with_progress(response, f, done, total, chunk_size)
+
+            if total is None or done >= total:
+                break
+            raise IncompleteRead(b"", total - done)
+
+        except HTTPError as err:
+            if err.code == 416 and done:
+                break  # the partial file already has every byte
+            if err.code < 500 or attempt >= retries:
+                raise
+            attempt += 1
+            print(f"Download failed ({err}), retrying")
+            time.sleep(min(2**attempt, 30))
+        except (OSError, IncompleteRead) as err:
+            if attempt >= retries:
+                raise
+            attempt += 1
+            print(f"Download interrupted ({err!r}), resuming")
+            time.sleep(min(2**attempt, 30))
+
+    try:
+        verify_zip(part_file)
+    except BadZipFile:
+        os.remove(part_file)
+        raise
+    os.replace(part_file, filename)
+
+
+def copy_with_progress(response, f, done: int, total: int, chunk_size: int) -> int:
+    """
+    Copy the response into f one chunk at a time, printing the progress and
+    throughput every few seconds. Returns the bytes written to f in total.
+    """
+    started = time.monotonic()
+    reported = started
+    received = 0
+    while True:
+        chunk = response.read(chunk_size)
+        if not chunk:
+            break
+        f.write(chunk)
+        received += len(chunk)
+        now = time.monotonic()
+        if now - reported >= 5:
+            reported = now
+            rate = received / 1e6 / (now - started)
+            if total:
+                print(
+                    f"Downloaded {(done + received) / 1e6:.0f} of {total / 1e6:.0f} MB"
+                    + f" ({100 * (done + received) / total:.0f}%) at {rate:.1f} MB/s"
+                )
+            else:
+                print(f"Downloaded {(done + received) / 1e6:.0f} MB at {rate:.1f} MB/s")
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    print(f"Received {received / 1e6:.1f} MB in {elapsed:.0f}s")
+    return done + received
+
 
-    return (results_dir, name)
+def verify_zip(filename: str):
+    """
+    Check the CRC of every member of a zip, raising BadZipFile on corruption.
+    """
+    with ZipFile(filename, "r") as rz:
+        bad = rz.testzip()
+    if bad is not None:
+        raise BadZipFile(f"Bad CRC for '{bad}' in {filename}")
+
+
+# Concurrent range requests, each on its own connection
+RemoteConnections = 4
+# Members closer than this are fetched in one request, gap included
+RangeGapBytes = 1 << 16
+# Largest single range request, so the requests spread over the connections
+RangeMaxBytes = 1 << 23
+# The end of central directory record and the longest possible zip comment
+ZipTailBytes = 22 + (1 << 16)
+
+
+def is_result_member(name: str) -> bool:
+    basename = name.rsplit("/", 1)[-1]
+    return basename in AllowedFileNames or basename == "test_metadata.json"
+
+
+def fetch_zip_members(url: str, filename: str, selected) -> bool:
+    """
+    Fetch the members of a remote zip for which selected(name) is true into a
+    sparse local copy of the zip: the end records and central directory are
+    read first with range requests, then the byte ranges of the selected
+    members, coalesced and fetched on RemoteConnections connections. The copy
+    has the same size and offsets as the remote zip, so ZipFile reads the
+    fetched members as usual; the other members are holes that take no disk
+    space on filesystems with sparse files. Returns False, having fetched
+    nothing more, if the server does not support range requests.
+    """
+    request = Request(url, headers={"Range": f"bytes=-{ZipTailBytes}"})
+    with urlopen(request, timeout=60) as response:
+        if response.status != 206:
+            return False
+        # follow redirects once, the range requests go to the final location
+        url = response.geturl()
+        total = int(response.headers["Content-Range"].rsplit("/", 1)[1])
+        tail = response.read()
+
+    part_file = filename + ".part"
+    with open(part_file, "wb") as f:
+        f.truncate(total)
+        f.seek(total - len(tail))
+        f.write(tail)
+
+    start, size = get_central_directory(tail, total)
+    with RangeFetcher(url, part_file) as fetcher:
+        if start < total - len(tail):
+            fetcher.fetch([(start, min(start + size, total - len(tail)))])
+
+        with ZipFile(part_file, "r") as rz:
+            infos = sorted(rz.infolist(), key=lambda i: i.header_offset)
+        # a member spans from its local header to the next member's, which
+        # also covers a local extra field and data descriptor of unknown length
+        ends = [i.header_offset for i in infos[1:]] + [start]
+        spans = [
+            (info.header_offset, end)
+            for info, end in zip(infos, ends)
+            if selected(info.filename) and not info.is_dir()
+        ]
+        ranges = coalesce_ranges(spans, RangeGapBytes, RangeMaxBytes)
+        fetcher.fetch(ranges)
+    fetched = sum(end - begin for begin, end in ranges)
+    print(
+        f"Fetched {len(spans)} members, {fetched / 1e6:.1f} MB of {total / 1e6:.1f} MB"
+        + f" in {len(ranges)} requests"
+    )
+
+    with ZipFile(part_file, "r") as rz:
+        for info in rz.infolist():
+            if selected(info.filename) and not info.is_dir():
+                # reading to the end checks the CRC
+                with rz.open(info) as member:
+                    while member.read(1 << 20):
+                        pass
+    os.replace(part_file, filename)
+    return True
+
+
+def get_central_directory(tail: bytes, total: int) -> Tuple[int, int]:
+    """
+    Find the offset and size of the central directory from the end of a zip,
+    following the zip64 end records when the offsets do not fit 32 bits.
+    """
+    at = tail.rfind(b"PK\x05\x06")
+    if at < 0:
+        raise BadZipFile("No end of central directory record found")
+    size, offset = struct.unpack("<LL", tail[at + 12 : at + 20])  # noqa: E203
+    if offset != 0xFFFFFFFF and size != 0xFFFFFFFF:
+        return offset, size
+
+    # the zip64 locator sits right before the end record and points at the
+    # zip64 end record, which sits right before it
+    locator = tail[at - 20 : at]  # noqa: E203
+    if locator[:4] != b"PK\x06\x07":
+        raise BadZipFile("No zip64 end of central directory locator found")
+    (record_offset,) = struct.unpack("<Q", locator[8:16])
+    record_at = record_offset - (total - len(tail))
+    record = tail[record_at : record_at + 56]  # noqa: E203
+    if record[:4] != b"PK\x06\x06":
+        raise BadZipFile("No zip64 end of central directory record found")
+    size, offset = struct.unpack("<QQ", record[40:56])
+    return offset, size
+
+
+def coalesce_ranges(
+    spans: List[Tuple[int, int]], gap: int, largest: int
+) -> List[Tuple[int, int]]:
+    """
+    Merge sorted [begin, end) byte ranges that are at most gap bytes apart,
+    as long as the merged range stays within largest bytes.
+    """
+    ranges = []
+    for begin, end in spans:
+        if ranges and begin - ranges[-1][1] <= gap and end - ranges[-1][0] <= largest:
+            ranges[-1] = (ranges[-1][0], max(end, ranges[-1][1]))
+        else:
+            ranges.append((begin, end))
+    return ranges
+
+
+class RangeFetcher(object):
+    """
+    Fetch byte ranges of a URL into the same offsets of a local file, with
+    RemoteConnections threads that each keep one connection open.
+    """
+
+    def __init__(self, url: str, filename: str, retries: int = 5):
+        self.url = urlparse(url)
+        self.filename = filename
+        self.retries = retries
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = []
+        self.pool = ThreadPoolExecutor(max_workers=RemoteConnections)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        self.pool.shutdown()
+        for connection in self.connections:
+            connection.close()
+
+    def fetch(self, ranges: List[Tuple[int, int]]):
+        with open(self.filename, "r+b") as self.file:
+            # each range is written as soon as it arrives, so at most one range
+            # per connection is held in memory
+            list(self.pool.map(self.fetch_range, ranges))
+
+    def get_connection(self) -> HTTPConnection:
+        if getattr(self.local, "connection", None) is None:
+            connection_type = (
+                HTTPSConnection if self.url.scheme == "https" else HTTPConnection
+            )
+            self.local.connection = connection_type(self.url.netloc, timeout=60)
+            with self.lock:
+                self.connections.append(self.local.connection)
+        return self.local.connection
+
+    def fetch_range(self, byte_range: Tuple[int, int]) -> int:
+        begin, end = byte_range
+        path = self.url.path + (f"?{self.url.query}" if self.url.query else "")
+        attempt = 0
+        while True:
+            connection = self.get_connection()
+            try:
+                connection.request(
+                    "GET", path, headers={"Range": f"bytes={begin}-{end - 1}"}
+                )
+                response = connection.getresponse()
+                data = response.read()
+                if response.status != 206:
+                    raise HTTPError(
+                        self.url.geturl(),
+                        response.status,
+                        response.reason,
+                        response.headers,
+                        None,
+                    )
+                if len(data) != end - begin:
+                    raise IncompleteRead(data, end - begin - len(data))
+                with self.lock:
+                    self.file.seek(begin)
+                    self.file.write(data)
+                return len(data)
+            except (OSError, HTTPException) as err:
+                # the connection may be unusable, open a new one on retry
+                connection.close()
+                self.local.connection = None
+                if attempt >= self.retries or (
+                    isinstance(err, HTTPError) and err.code < 500
+                ):
+                    raise
+                attempt += 1
+                time.sleep(min(2**attempt, 30))
+
+
+def serve(port: int, docs: str = "docs") -> ThreadingHTTPServer:
+    """
+    Serve the docs directory on the port from a background thread.
+    """
+    server = ThreadingHTTPServer(
+        ("", port), partial(DocsRequestHandler, directory=docs)
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving {docs} at http://localhost:{port}/")
+    return server
+
+
+class DocsRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Serve files with their precompressed .br or .gz copy when the client
+    accepts it, a strong ETag from the content, and long-lived caching for
+    the directories of processed runs while the rest is revalidated.
+    """
+
+    protocol_version = "HTTP/1.1"  # keep connections alive between fetches
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) and self.path.split("?")[0].endswith("/"):
+            path = os.path.join(path, "index.html")
+        if not os.path.isfile(path):
+            # directories and missing files as usual
+            return super().send_head()
+
+        accepted = get_accepted_encodings(self.headers.get("Accept-Encoding", ""))
+        filename, encoding = get_encoded_file(path, accepted)
+        f = open(filename, "rb")
+        try:
+            stat = os.fstat(f.fileno())
+            etag = get_etag(filename, stat.st_size, stat.st_mtime_ns)
+            matches = self.headers.get("If-None-Match", "")
+            status = 304 if etag in matches or matches.strip() == "*" else 200
+            self.send_response(status)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", get_cache_control(self.directory, path))
+            self.send_header("Vary", "Accept-Encoding")
+            if status == 304:
+                self.end_headers()
+                f.close()
+                return None
+
+            self.send_header("Content-Type", self.guess_type(path))
+            if encoding:
+                self.send_header("Content-Encoding", encoding)
+            self.send_header("Content-Length", str(stat.st_size))
+            self.send_header("Last-Modified", self.date_time_string(stat.st_mtime))
+            self.end_headers()
+            return f
+        except BaseException:
+            f.close()
+            raise
+
+
+# Precompressed copies served in order of preference, and their encoding
+CompressedCopies = [(".br", "br"), (".gz", "gzip")]
+
+
+def get_accepted_encodings(header: str) -> List[str]:
+    """
+    The content codings of an Accept-Encoding header, without those refused
+    with q=0.
+    """
+    accepted = []
+    for part in header.split(","):
+        coding, _, parameters = part.partition(";")
+        if re.fullmatch(r"\s*q\s*=\s*0(\.0*)?\s*", parameters):
+            continue
+        accepted.append(coding.strip().lower())
+    return accepted
+
+
+def get_encoded_file(path: str, accepted: List[str]) -> Tuple[str, str]:
+    """
+    The precompressed copy of a file to send and its encoding, or the file
+    itself and None. Copies older than the file are ignored.
+    """
+    for extension, encoding in CompressedCopies:
+        copy = path + extension
+        if (encoding in accepted or "*" in accepted) and os.path.isfile(copy):
+            if os.path.getmtime(copy) >= os.path.getmtime(path):
+                return copy, encoding
+    return path, None
+
+
+@lru_cache(maxsize=1024)
+def get_etag(filename: str, size: int, mtime_ns: int) -> str:
+    """
+    A strong ETag from the content of a file, cached while its size and
+    modification time stay the same. Output written again byte for byte keeps
+    its ETag.
+    """
+    digest = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for chunk in iter(partial(f.read, 1 << 20), b""):
+            digest.update(chunk)
+    return f'"{digest.hexdigest()}"'
+
+
+def get_cache_control(docs: str, path: str) -> str:
+    """
+    Files under the directory of a run in result_directories.json never
+    change once processed, everything else is revalidated.
+    """
+    parts = os.path.relpath(path, docs).replace(os.sep, "/").split("/")
+    record = os.path.join(docs, "result_directories.json")
+    if len(parts) > 1 and os.path.isfile(record):
+        if parts[0] in get_recorded_runs(record, os.stat(record).st_mtime_ns):
+            return ImmutableCacheControl
+    return RevalidateCacheControl
+
+
+@lru_cache(maxsize=4)
+def get_recorded_runs(record: str, mtime_ns: int) -> set:
+    with open(record, "r") as f:
+        return set(json.load(f))
+
+
+def is_url(arg: str) -> bool:
+    as_url = urlparse(arg)
+    return as_url.scheme == "https" and len(as_url.netloc.split(".")) > 1
+
+
+def find_results_dirs(path: str) -> List[str]:
+    """
+    List the timestamped results directories of a downloaded or given run.
+    """
+    # use the results subdirectory if given unzipped path or the zip itself
+    as_unzipped_azure = os.path.join(
+        path, "mnt", "tfb", "FrameworkBenchmarks", "results"
+    )
+    as_unzipped_citrine = os.path.join(path, "results")
+    if is_results_dir(as_unzipped_azure):
+        path = as_unzipped_azure
+    elif is_results_dir(as_unzipped_citrine):
+        path = as_unzipped_citrine
+
+    return list_results_dirs(path)
+
+
+def get_batch_targets(args: List[str], batch_file: str = None) -> List[Tuple]:
+    """
+    Read the runs of a batch from the arguments and the batch file, each a URL
+    or a path followed by a name. In the file '#' starts a comment.
+    """
+    words = list(args)
+    if batch_file:
+        with open(batch_file, "r") as f:
+            for line in f:
+                words.extend(line.split("#", 1)[0].split())
+
+    targets = []
+    while words:
+        word = words.pop(0)
+        if is_url(word):
+            targets.append((word, None))
+        elif words:
+            targets.append((word, words.pop(0)))
+        else:
+            raise ValueError(f"Missing the name for results at '{word}'")
+
+    if not targets:
+        raise ValueError("No runs given for the batch")
+    return targets
 
 
 def print_help():
     print(
         "Required arguments (choose one):"
         + "\n- HTTPS URL to the results page of a run at https://tfb-status.techempower.com/"
-        + "\n- Existing directory path followed by a name of your choice for results"
+        + "\n- Existing directory or results.zip path followed by a name of your"
+        + " choice for results"
+        + "\nOptional arguments:"
+        + "\n--jobs N: parse frameworks in N worker processes (0 for one per CPU)"
+        + "\n--parser=fast|pyparsing|check: raw.txt parser, 'check' runs both and"
+        + " fails on any difference"
+        + "\n--force: parse every framework again instead of reusing unchanged results"
+        + "\n--ramp-up=SECONDS: skip the first seconds of each dstat window (default 1)"
+        + "\n--confidence[=RESAMPLES]: add 95% bootstrap intervals of the memory and"
+        + " CPU mean, median and stdev, from 1000 resamples by default"
+        + "\n--store=DIR: also save each framework's dstat series to DIR/<name>"
+        + "\n--from-store=DIR: summarize DIR/<name> again, give only the name"
+        + "\n--batch: process many runs, each a URL or a path followed by a name"
+        + "\n--batch=FILE: also process the runs listed in FILE, one per line"
+        + "\n--format=json|columnar: write rows, or one array per field (smaller)"
+        + "\n--compress: also write .gz copies, and .br ones if brotli is installed"
+        + "\n--history: update the per-framework history in docs/history, alone or"
+        + " after processing runs"
+        + "\n--remote: fetch only the files that are parsed from a run's results.zip"
+        + " with HTTP range requests, instead of downloading all of it"
+        + "\n--profile[=FILE]: time every stage and unit, write a JSON report to FILE"
+        + " (profile.json) and print the slowest units"
+        + "\n--profile-top=N: slowest units to print (default 10)"
+        + "\n--cprofile=STAGE: with --profile, also run a stage under cProfile, one"
+        + " of: discovery, verification, raw, stats, aggregate, encode, write"
+        + "\n--watch[=SECONDS]: poll tfb-status every SECONDS (600) and process"
+        + " every new completed run, until interrupted"
+        + "\n--watch-url=URL: status page listing the runs to watch"
+        + "\n--serve[=PORT]: serve docs on PORT (8000) with precompressed files and"
+        + " cache headers, until interrupted or while watching"
+        + "\n--sqlite[=FILE]: load the summaries of every run into the SQLite"
+        + " database FILE (results.db), alone or after processing runs"
+        + "\n--api[=PORT]: serve a JSON query API over the --sqlite database on"
+        + " PORT (8001), until interrupted or while watching"
+        + "\n--api-host=HOST: interface the API listens on (127.0.0.1), e.g. 0.0.0.0"
+        + " for all"
+        + "\n--help, -h: print these arguments and options"
     )
 
 
+def parse_options(args: List[str]) -> Tuple[Options, List[str]]:
+    """
+    Split '--name value' or '--name=value' options from the positional arguments.
+    """
+    options = Options()
+    positional = []
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg in ("-h", "--help"):
+            options.help = True
+            continue
+        if not arg.startswith("--"):
+            positional.append(arg)
+            continue
+
+        key, _, value = arg[2:].partition("=")
+        if key == "jobs":
+            if not value:
+                if not args:
+                    raise ValueError("--jobs requires a number")
+                value = args.pop(0)
+            options.jobs = int(value) if int(value) > 0 else os.cpu_count() or 1
+        elif key == "parser":
+            if value not in {"fast", "pyparsing", "check"}:
+                raise ValueError("--parser must be one of: fast, pyparsing, check")
+            options.parser = value
+        elif key == "force":
+            options.force = True
+        elif key == "ramp-up":
+            options.ramp_up = float(value)
+        elif key == "confidence":
+            options.confidence = int(value) if value else BootstrapResamples
+        elif key == "store":
+            options.store = value
+        elif key == "from-store":
+            options.from_store = value
+        elif key == "batch":
+            options.batch = True
+            options.batch_file = value or None
+        elif key == "format":
+            if value not in {"json", "columnar"}:
+                raise ValueError("--format must be one of: json, columnar")
+            options.format = value
+        elif key == "compress":
+            options.compress = True
+        elif key == "history":
+            options.history = True
+        elif key == "remote":
+            options.remote = True
+        elif key == "profile":
+            options.profile = value or "profile.json"
+        elif key == "profile-top":
+            options.profile_top = int(value)
+        elif key == "cprofile":
+            options.cprofile = value
+        elif key == "watch":
+            options.watch = float(value) if value else WatchSeconds
+        elif key == "watch-url":
+            options.watch_url = value
+        elif key == "serve":
+            options.serve = int(value) if value else ServePort
+        elif key == "sqlite":
+            options.sqlite = value or SqliteDatabase
+        elif key == "api":
+            options.api = int(value) if value else ApiPort
+        elif key == "api-host":
+            options.api_host = value
+        else:
+            raise ValueError(f"Unknown option '{arg}'")
+
+    return options, positional
+
+
 def main(args):
+    try:
+        options, args = parse_options(args)
+    except ValueError as err:
+        print(err)
+        print_help()
+        return
+    if options.help:
+        print_help()
+        return
+
+    if options.cprofile and not options.profile:
+        options.profile = "profile.json"
+    if options.profile:
+        start_profile(options)
+
+    if options.api and not options.sqlite:
+        options.sqlite = SqliteDatabase
+    server = serve(options.serve) if options.serve else None
+    if (
+        args
+        or options.batch_file
+        or not (options.history or options.watch or options.sqlite or server)
+    ):
+        process(args, options)
+    if options.history:
+        with timed("history"):
+            update_history(compress=options.compress)
+    if options.sqlite:
+        with timed("sqlite"):
+            update_sqlite(options.sqlite)
+    if options.api:
+        start_api(options.api, options.sqlite, options.api_host or ApiHost)
+    if options.watch:
+        watch(options)
+    elif server or options.api:
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            print("Stopped serving")
+    if server:
+        server.shutdown()
+
+    if options.profile:
+        write_profile_report(options)
+
+
+def process(args: List[str], options: Options):
+    if options.from_store:
+        if len(args) != 1:
+            print_help()
+            return
+        start_from_store(args[0], options)
+        return
+
+    if options.batch:
+        try:
+            targets = get_batch_targets(args, options.batch_file)
+        except ValueError as err:
+            print(err)
+            print_help()
+            return
+        start_batch(targets, options)
+        return
+
     if len(args) == 1:
-        # check if we have a URL
-        as_url = urlparse(args[0])
-        if as_url.scheme == "https" and len(as_url.netloc.split(".")) > 1:
+        if is_url(args[0]):
             print(f"Getting result summary at {args[0]}")
-            path, name = download_results(args[0])
+            path, name = download_results(args[0], options.remote)
         else:
             print_help()
+            return
     elif len(args) == 2:
         path, name = args[0], args[1]
     else:
         print_help()
         return
 
-    if not os.path.isdir(path):
-        print(f"'{path}' is not a directory")
+    if not is_results_dir(path):
+        print(f"'{path}' is not a directory or zip")
         return
 
-    # use the results subdirectory if given unzipped path
-    as_unzipped_azure = os.path.join(
-        path, "mnt", "tfb", "FrameworkBenchmarks", "results"
-    )
-    as_unzipped_citrine = os.path.join(path, "results")
-    if os.path.isdir(as_unzipped_azure):
-        path = as_unzipped_azure
-    elif os.path.isdir(as_unzipped_citrine):
-        path = as_unzipped_citrine
-
-    start([(d, name) for d in os.scandir(path) if d.is_dir()])
+    start([(d, name) for d in find_results_dirs(path)], options)
 
 
 if __name__ == "__main__":